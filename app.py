@@ -1,17 +1,32 @@
 # app.py
-import runpy
 import uuid
 import streamlit as st
 
 from log_utils import append_simple_log
+from metrics import start_metrics_export
+from page_registry import load_page, render_page
+from perf_trace import debug_panel_requested, render_debug_panel, script_run, span, timed_fragment
+from radar_charts import start_radar_warmup
 
 # アプリ全体のページ設定
 st.set_page_config(page_title="柑橘類の推薦システム", page_icon="🍊", layout="wide")
 
-# ==== LINE OAuth====
-oauth_ns = runpy.run_path("pages/3_line_oauth.py")
-oauth_ns["handle_line_oauth"]()
-# =========================================
+# 結果カードのレーダーチャートを裏で描いておく（版が変わったときだけ描き直す）
+start_radar_warmup()
+
+# secrets.toml に metrics_path / metrics_port があれば，メトリクスの書き出しを始める（プロセスにつき1回）
+start_metrics_export()
+
+@timed_fragment("nav")
+def nav_button(label: str, route: str) -> None:
+    """
+    ルートを切り替えるボタン．フラグメントにしておき，押したときはこのボタンだけを
+    再実行してから移動先のルートでアプリ全体を1回だけ実行する（今のページは描き直さない）．
+    """
+    if st.button(label, use_container_width=True):
+        st.session_state["route"] = route
+        st.rerun()
+
 
 # ====ログイン有無・ユーザー情報====
 if "user_logged_in" not in st.session_state:
@@ -35,126 +50,131 @@ if "input_submitted" not in st.session_state:
 
 route = st.session_state["route"]
 
-# ===== DEBUG（原因特定用：一時的）=====
-# st.write("DEBUG route:", st.session_state.get("route"))
-# st.write("DEBUG logged_in:", st.session_state.get("user_logged_in"))
-# =====================================
+# ルートごとの実行時間を perf_trace に記録する（st.rerun() で抜けた場合も含む）
+with script_run(route):
+    # ==== LINE OAuth====
+    # セッションの初期化は未設定のキーだけなので，OAuth のコールバックで入れた値は上書きされない
+    with span("oauth"):
+        load_page("pages/3_line_oauth.py").handle_line_oauth()
+    # =========================================
 
-# ===== top ページ（未ログイン）=====
-if route == "top":
-    runpy.run_path("pages/1_top.py")
+    # ===== DEBUG（原因特定用：一時的）=====
+    # st.write("DEBUG route:", st.session_state.get("route"))
+    # st.write("DEBUG logged_in:", st.session_state.get("user_logged_in"))
+    # =====================================
 
-    if st.session_state.get("navigate_to") == "input":
-        st.session_state["route"] = "input"
-        del st.session_state["navigate_to"]
-        st.rerun()
+    # ===== top ページ（未ログイン）=====
+    if route == "top":
+        render_page("pages/1_top.py")
 
-    if st.session_state.get("navigate_to") == "login":
-        st.session_state["route"] = "login"
-        del st.session_state["navigate_to"]
-        st.rerun()
+        if st.session_state.get("navigate_to") == "input":
+            st.session_state["route"] = "input"
+            del st.session_state["navigate_to"]
+            st.rerun()
 
-# ===== top_login ページ（ログイン後トップ）=====
-elif route == "top_login":
-    runpy.run_path("pages/1_top_login.py")
+        if st.session_state.get("navigate_to") == "login":
+            st.session_state["route"] = "login"
+            del st.session_state["navigate_to"]
+            st.rerun()
 
-    if st.session_state.get("navigate_to") == "input":
-        st.session_state["route"] = "input"
-        del st.session_state["navigate_to"]
-        st.rerun()
+    # ===== top_login ページ（ログイン後トップ）=====
+    elif route == "top_login":
+        render_page("pages/1_top_login.py")
 
-    if st.session_state.get("navigate_to") == "logout":
-        st.session_state["user_logged_in"] = False
-        st.session_state["auth_provider"] = None
-        st.session_state["user_id"] = None
-        st.session_state["user_name"] = None
-        st.session_state["user_email"] = None
-        st.session_state["user_picture"] = None
-        st.session_state["route"] = "top"
-        del st.session_state["navigate_to"]
-        st.rerun()
+        if st.session_state.get("navigate_to") == "input":
+            st.session_state["route"] = "input"
+            del st.session_state["navigate_to"]
+            st.rerun()
 
-# ===== input ページ =====
-elif route == "input":
-    runpy.run_path("pages/2_input.py")
-
-    if st.session_state.get("input_submitted"):
-        st.session_state["input_submitted"] = False
-
-        input_dict = st.session_state.get("user_preferences")
-        if not isinstance(input_dict, dict):
-            st.error("入力内容の取得に失敗した．もう一度入力してほしい．")
-        else:
-            try:
-                sweetness = int(input_dict["brix"])
-                sourness = int(input_dict["acid"])
-                bitterness = int(input_dict["bitterness"])
-                aroma = int(input_dict["aroma"])
-                juiciness = int(input_dict["moisture"])
-                texture = int(input_dict["texture"])
-            except Exception as e:
-                st.error(f"入力値の取得に失敗した．もう一度入力してほしい．（詳細: {e}）")
-            else:
-                logic_ns = runpy.run_path("pages/2_calculation_logic.py")
-                calculate_top3_ids = logic_ns["calculate_top3_ids"]
+        if st.session_state.get("navigate_to") == "logout":
+            st.session_state["user_logged_in"] = False
+            st.session_state["auth_provider"] = None
+            st.session_state["user_id"] = None
+            st.session_state["user_name"] = None
+            st.session_state["user_email"] = None
+            st.session_state["user_picture"] = None
+            st.session_state["route"] = "top"
+            del st.session_state["navigate_to"]
+            st.rerun()
+
+    # ===== input ページ =====
+    elif route == "input":
+        render_page("pages/2_input.py")
+
+        if st.session_state.get("input_submitted"):
+            st.session_state["input_submitted"] = False
 
+            input_dict = st.session_state.get("user_preferences")
+            if not isinstance(input_dict, dict):
+                st.error("入力内容の取得に失敗した．もう一度入力してほしい．")
+            else:
                 try:
-                    top_ids = calculate_top3_ids(
-                        sweetness=sweetness,
-                        sourness=sourness,
-                        bitterness=bitterness,
-                        aroma=aroma,
-                        juiciness=juiciness,
-                        texture=texture,
-                    )
+                    sweetness = int(input_dict["brix"])
+                    sourness = int(input_dict["acid"])
+                    bitterness = int(input_dict["bitterness"])
+                    aroma = int(input_dict["aroma"])
+                    juiciness = int(input_dict["moisture"])
+                    texture = int(input_dict["texture"])
                 except Exception as e:
-                    st.error(f"類似度計算中にエラーが発生した．R2の設定やCSVを確認してほしい．（詳細: {e}）")
+                    st.error(f"入力値の取得に失敗した．もう一度入力してほしい．（詳細: {e}）")
                 else:
-                    st.session_state["top_ids"] = top_ids
-                    st.session_state["sid"] = str(uuid.uuid4()) # 診断ごとに新しい session_id を採番する by 本間
-                    result_for_log = [
-                        {"id": int(item_id), "rank": rank}
-                        for rank, item_id in enumerate(top_ids, start=1)
-                    ]
-                    append_simple_log(input_dict=input_dict, result_value=result_for_log)
-
-                    if st.session_state["user_logged_in"]:
-                        st.session_state["route"] = "result_login"
+                    try:
+                        # 推薦ロジック（numpy/pandas/boto3 を読む）は最初の診断のときに1回だけ読み込む
+                        calculate_top3_ids = load_page("pages/2_calculation_logic.py").calculate_top3_ids
+                        top_ids = calculate_top3_ids(
+                            sweetness=sweetness,
+                            sourness=sourness,
+                            bitterness=bitterness,
+                            aroma=aroma,
+                            juiciness=juiciness,
+                            texture=texture,
+                        )
+                    except Exception as e:
+                        st.error(f"類似度計算中にエラーが発生した．R2の設定やCSVを確認してほしい．（詳細: {e}）")
                     else:
-                        st.session_state["route"] = "result"
-
-                    st.rerun()
-
-    with st.sidebar:
-        if st.button("← トップへ戻る", use_container_width=True):
+                        st.session_state["top_ids"] = top_ids
+                        st.session_state["sid"] = str(uuid.uuid4()) # 診断ごとに新しい session_id を採番する by 本間
+                        result_for_log = [
+                            {"id": int(item_id), "rank": rank}
+                            for rank, item_id in enumerate(top_ids, start=1)
+                        ]
+                        append_simple_log(input_dict=input_dict, result_value=result_for_log)
+
+                        if st.session_state["user_logged_in"]:
+                            st.session_state["route"] = "result_login"
+                        else:
+                            st.session_state["route"] = "result"
+
+                        st.rerun()
+
+        with st.sidebar:
+            nav_button("← トップへ戻る", "top")
+
+    # ===== login ページ =====
+    elif route == "login":
+        render_page("pages/3_Login.py")
+
+    # ===== 結果表示ページ =====
+    elif route == "result_login":
+        if not st.session_state.get("top_ids"):
             st.session_state["route"] = "top"
             st.rerun()
 
-# ===== login ページ =====
-elif route == "login":
-    runpy.run_path("pages/3_Login.py")
+        render_page("pages/3_output_login.py")
 
-# ===== 結果表示ページ =====
-elif route == "result_login":
-    if not st.session_state.get("top_ids"):
-        st.session_state["route"] = "top"
-        st.rerun()
-
-    runpy.run_path("pages/3_output_login.py")
+        with st.sidebar:
+            nav_button("← 入力に戻る", "input")
 
-    with st.sidebar:
-        if st.button("← 入力に戻る", use_container_width=True):
-            st.session_state["route"] = "input"
+    elif route == "result":
+        if not st.session_state.get("top_ids"):
+            st.session_state["route"] = "top"
             st.rerun()
 
-elif route == "result":
-    if not st.session_state.get("top_ids"):
-        st.session_state["route"] = "top"
-        st.rerun()
+        render_page("pages/3_output_nologin.py")
 
-    runpy.run_path("pages/3_output_nologin.py")
+        with st.sidebar:
+            nav_button("← 入力に戻る", "input")
 
-    with st.sidebar:
-        if st.button("← 入力に戻る", use_container_width=True):
-            st.session_state["route"] = "input"
-            st.rerun()
\ No newline at end of file
+    # ?debug=<trace_debug_key> のときだけ，サイドバーに計測パネルを出す
+    if debug_panel_requested():
+        render_debug_panel()
@@ -0,0 +1,51 @@
+# bench/bench_answer_table.py
+"""
+事前計算表（6**6 通り）の表引きと，その場での距離計算の速度を比べるベンチマーク．
+
+使い方：
+    python bench/bench_answer_table.py [品種数 ...]
+
+R2 には接続せず，乱数で作った柑橘データで計測する．
+"""
+import sys
+import time
+
+import numpy as np
+
+from synthetic_index import logic, make_index
+
+
+def per_call_us(fn, queries) -> float:
+    t0 = time.perf_counter()
+    for q in queries:
+        fn(q)
+    return (time.perf_counter() - t0) / len(queries) * 1e6
+
+
+def main(sizes):
+    rng = np.random.default_rng(1)
+    queries = rng.integers(1, 7, (2000, len(logic.FEATURES)))
+
+    print(f"{'items':>8} {'build[s]':>9} {'live[us]':>9} {'table[us]':>10} {'speedup':>8}")
+    for n in sizes:
+        index = make_index(n)
+
+        t0 = time.perf_counter()
+        table = logic.build_answer_table(index)
+        build_s = time.perf_counter() - t0
+
+        live = per_call_us(lambda q: logic.calculate_topk_batch(q[None, :], k=3, index=index)[0], queries)
+        lookup = per_call_us(lambda q: index.ids[table[logic.preference_code(q)]], queries)
+
+        # 表引きの結果がその場の計算と一致することも確認しておく
+        sample = queries[:200]
+        assert np.array_equal(
+            index.ids[table[logic.preference_code(sample)]],
+            logic.calculate_topk_batch(sample, k=3, index=index),
+        )
+
+        print(f"{n:>8} {build_s:>9.2f} {live:>9.1f} {lookup:>10.1f} {live / lookup:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main([int(a) for a in sys.argv[1:]] or [40, 1000, 10000])
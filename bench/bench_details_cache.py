@@ -0,0 +1,62 @@
+# bench/bench_details_cache.py
+"""
+詳細XLSXの読み込みについて，openpyxl でのパースと Parquet キャッシュからの
+読み込みのコールドスタート時間を比べるベンチマーク．
+
+使い方：
+    python bench/bench_details_cache.py [XLSXのパス] [繰り返し回数]
+
+計測ごとに新しい Python プロセスを起動し，import 済みの状態から
+catalogue._parse_details_xlsx() が返るまでの時間を測る．R2 には接続しない．
+"""
+import json
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+
+CHILD = """
+import json, sys, time
+from pathlib import Path
+sys.path.insert(0, {root!r})
+import catalogue
+catalogue.DATASET_CACHE_DIR = Path({cache_dir!r})
+body = Path({xlsx!r}).read_bytes()
+t0 = time.perf_counter()
+df = catalogue._parse_details_xlsx(body)
+print(json.dumps({{"seconds": time.perf_counter() - t0, "rows": len(df)}}))
+"""
+
+
+def run_child(xlsx: Path, cache_dir: Path) -> dict:
+    code = CHILD.format(root=str(ROOT_DIR), cache_dir=str(cache_dir), xlsx=str(xlsx))
+    out = subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, text=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main(xlsx: Path, repeat: int):
+    cold, warm = [], []
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory() as tmp:
+            cache_dir = Path(tmp)
+            first = run_child(xlsx, cache_dir)    # キャッシュ無し：openpyxl でパースして保存
+            second = run_child(xlsx, cache_dir)   # 2回目の起動：Parquet を読む
+            assert first["rows"] == second["rows"]
+            cold.append(first["seconds"])
+            warm.append(second["seconds"])
+
+    cold_ms = statistics.median(cold) * 1e3
+    warm_ms = statistics.median(warm) * 1e3
+    print(f"rows: {first['rows']}  file: {xlsx.name} ({xlsx.stat().st_size / 1024:.0f} KiB)")
+    print(f"{'':>14} {'median[ms]':>11}")
+    print(f"{'xlsx(openpyxl)':>14} {cold_ms:>11.1f}")
+    print(f"{'parquet cache':>14} {warm_ms:>11.1f}")
+    print(f"speedup: {cold_ms / warm_ms:.1f}x")
+
+
+if __name__ == "__main__":
+    path = Path(sys.argv[1]) if len(sys.argv) > 1 else ROOT_DIR / "citrus_details_list.xlsx"
+    main(path, int(sys.argv[2]) if len(sys.argv) > 2 else 5)
@@ -0,0 +1,65 @@
+# bench/bench_fragment_reruns.py
+"""
+入力ページの操作1回あたりのスクリプト実行時間を，フラグメント化の前後で比べるベンチマーク．
+
+使い方：
+    python bench/bench_fragment_reruns.py [繰り返し回数]
+
+streamlit.testing の AppTest で app.py を input ルートから動かし，perf_trace の
+集計（run_stats）から
+
+- アプリ全体の1回の実行時間（input/app）
+- 各フラグメント（1〜6ボタン・ヒント・サイドバーの戻るボタン）の実行時間
+
+を読む．以前は操作のたびに「押した回の全体実行＋st.rerun() による全体実行」の
+2回が走っていたので，前 = 全体実行 × 2，後 = フラグメント1回 として並べる．
+AppTest はフラグメントだけの再実行を再現しないため，後の値はアプリ全体の実行の中で
+測ったフラグメント本体の時間である（本番では run_stats の fragment_reruns で確認できる）．
+"""
+import sys
+from pathlib import Path
+
+from streamlit.testing.v1 import AppTest
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+import perf_trace
+
+INTERACTIONS = [
+    ("1〜6ボタン", "fragment:scale", lambda at, n: at.button(key=f"btn_val_brix_{n % 6 + 1}").click()),
+    ("ヒント", "fragment:hints", lambda at, n: at.button(key="btn_right_ビターな大人へ").click()),
+]
+
+
+def main(repeat: int):
+    at = AppTest.from_file(str(ROOT_DIR / "app.py"), default_timeout=60)
+    at.secrets["input_mode"] = "buttons"
+    at.session_state["route"] = "input"
+    at.run()
+
+    for n in range(repeat):
+        for _, _, action in INTERACTIONS:
+            action(at, n).run()
+
+    # サイドバーの戻るボタン：押した回のフラグメント＋移動先（top）の全体実行になる
+    next(b for b in at.button if b.label == "← トップへ戻る").click().run()
+    assert at.session_state["route"] == "top"
+
+    stats = perf_trace.run_stats()
+    full_ms = stats["input/app"]["avg_ms"]
+    top_ms = stats["top/app"]["avg_ms"]
+    rows = [
+        (label, 2 * full_ms, stats[f"input/{scope}"]["avg_ms"]) for label, scope, _ in INTERACTIONS
+    ]
+    rows.append(("戻るボタン", full_ms + top_ms, stats["input/fragment:nav"]["avg_ms"] + top_ms))
+
+    print(f"input page full run: {full_ms:.2f} ms (avg of {stats['input/app']['count']})")
+    print(f"{'interaction':<14} {'before[ms]':>11} {'after[ms]':>10}")
+    for label, before, after in rows:
+        print(f"{label:<14} {before:>11.2f} {after:>10.2f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
@@ -0,0 +1,138 @@
+# bench/bench_import_profile.py
+"""
+ルートごとの import 時間を測るベンチマーク．
+
+使い方：
+    python bench/bench_import_profile.py [--json 出力先] [--top 件数] [ルート名 ...]
+
+ルートごとに新しい Python プロセスを `-X importtime` 付きで起動し，
+streamlit を読み込んだ後（全ルート共通のため除外）に
+
+1. app.py が先頭で import するモジュール
+2. 毎回読み込まれる pages/3_line_oauth.py
+3. そのルートで描画するページ（ROUTES）
+
+を page_registry.load_page と同じ手順で読み込んで，その間の import を集計する．
+重いモジュール（HEAVY）がどのルートで読み込まれたかも表示する．
+--json を付けると結果を JSON で保存するので，手元で前後比較ができる．
+"""
+import argparse
+import ast
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+
+# app.py のルートと，そのルートで読み込まれるページ（submit は診断ボタンを押したとき）
+ROUTES = {
+    "top": ["pages/1_top.py"],
+    "top_login": ["pages/1_top_login.py"],
+    "input": ["pages/2_input.py"],
+    "submit": ["pages/2_input.py", "pages/2_calculation_logic.py"],
+    "login": ["pages/3_Login.py"],
+    "result": ["pages/3_output_nologin.py"],
+    "result_login": ["pages/3_output_login.py"],
+}
+ALWAYS = ["pages/3_line_oauth.py"]
+
+HEAVY = ["matplotlib", "boto3", "botocore", "pandas", "numpy", "jwt", "requests", "PIL", "pyarrow"]
+
+MARKER = "import time: ---- route ----"
+
+CHILD = """
+import sys
+sys.path.insert(0, {root!r})
+import streamlit
+sys.stderr.write({marker!r} + "\\n")
+sys.stderr.flush()
+import importlib
+for name in {app_imports!r}:
+    importlib.import_module(name)
+from page_registry import load_page
+for rel in {pages!r}:
+    load_page(rel)
+"""
+
+
+def app_imports() -> list:
+    """app.py の先頭で import しているモジュール名（streamlit 以外）を返す．"""
+    tree = ast.parse((ROOT_DIR / "app.py").read_text(encoding="utf-8"))
+    names = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            names += [a.name for a in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.module:
+            names.append(node.module)
+    return [n for n in names if n.split(".")[0] != "streamlit"]
+
+
+def parse_importtime(stderr: str) -> list:
+    """MARKER 以降の `-X importtime` 出力を (name, self_us, cumulative_us, depth) の並びにする．"""
+    rows, started = [], False
+    for line in stderr.splitlines():
+        if line.startswith(MARKER):
+            started = True
+            continue
+        if not started or not line.startswith("import time:") or "self [us]" in line:
+            continue
+        body = line[len("import time:"):].split("|")
+        name = body[2]
+        depth = (len(name) - len(name.lstrip(" ")) - 1) // 2
+        rows.append((name.strip(), int(body[0]), int(body[1]), depth))
+    return rows
+
+
+def profile_route(route: str) -> dict:
+    pages = ALWAYS + ROUTES[route]
+    code = CHILD.format(root=str(ROOT_DIR), marker=MARKER, app_imports=app_imports(), pages=pages)
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT_DIR, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"{route}: 読み込みに失敗した\n{proc.stderr[-2000:]}")
+
+    rows = parse_importtime(proc.stderr)
+    top_level = [r for r in rows if r[3] == 0]
+    loaded = {r[0] for r in rows}
+    return {
+        "route": route,
+        "pages": pages,
+        "total_ms": round(sum(r[2] for r in top_level) / 1e3, 1),
+        "heavy": {h: (h in loaded) for h in HEAVY},
+        "modules": sorted(
+            ({"name": r[0], "cumulative_ms": round(r[2] / 1e3, 1)} for r in top_level),
+            key=lambda m: -m["cumulative_ms"],
+        ),
+    }
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser()
+    ap.add_argument("routes", nargs="*", default=list(ROUTES))
+    ap.add_argument("--json", type=Path, default=None)
+    ap.add_argument("--top", type=int, default=5)
+    args = ap.parse_args(argv)
+
+    results = [profile_route(r) for r in args.routes]
+
+    print(f"app.py imports: {', '.join(app_imports())}  (streamlit 本体は除く)")
+    print(f"{'route':<13} {'total[ms]':>9}  heavy modules loaded")
+    for res in results:
+        heavy = ", ".join(h for h, on in res["heavy"].items() if on) or "-"
+        print(f"{res['route']:<13} {res['total_ms']:>9.1f}  {heavy}")
+
+    for res in results:
+        print(f"\n[{res['route']}] top {args.top} (cumulative ms)")
+        for m in res["modules"][: args.top]:
+            print(f"  {m['cumulative_ms']:>8.1f}  {m['name']}")
+
+    if args.json:
+        args.json.write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"\nwrote {args.json}")
+
+
+if __name__ == "__main__":
+    main()
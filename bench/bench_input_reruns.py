@@ -0,0 +1,93 @@
+# bench/bench_input_reruns.py
+"""
+入力ページで診断を1回完了するまでの，スクリプトの実行回数と送信量を比べるベンチマーク．
+
+使い方：
+    python bench/bench_input_reruns.py
+
+streamlit.testing の AppTest で pages/2_input.py だけを描画し，
+input_mode = buttons（既定）と compact のそれぞれで
+「6項目を選んでヒントを1つ見て完了を押す」までを操作する．
+
+- runs  : スクリプトの実行回数（st.rerun() による再実行を含む）
+- bytes : 各実行で送られる要素（protobuf）の大きさの合計．
+          Streamlit は実行のたびに全要素を送り直すので，実行後の要素の大きさ × 実行回数で見積もる
+"""
+import sys
+from pathlib import Path
+
+from streamlit.testing.v1 import AppTest
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+
+SCRIPT = f"""
+import sys
+sys.path.insert(0, {str(ROOT_DIR)!r})
+import streamlit as st
+from page_registry import render_page
+
+st.session_state["bench_runs"] = st.session_state.get("bench_runs", 0) + 1
+render_page("pages/2_input.py")
+"""
+
+VALUES = {"val_brix": 5, "val_acid": 3, "val_bitterness": 2, "val_aroma": 4, "val_moisture": 6, "val_texture": 3}
+
+
+def tree_bytes(node) -> int:
+    """要素ツリーの protobuf の大きさ（バイト）を合計する．"""
+    proto = getattr(node, "proto", None)
+    size = proto.ByteSize() if proto is not None and hasattr(proto, "ByteSize") else 0
+    children = getattr(node, "children", {})
+    return size + sum(tree_bytes(c) for c in children.values())
+
+
+class Session:
+    def __init__(self, mode: str):
+        self.at = AppTest.from_string(SCRIPT, default_timeout=30)
+        self.at.secrets["input_mode"] = mode
+        self.runs = 0
+        self.bytes = 0
+
+    def step(self, action) -> None:
+        before = self.at.session_state["bench_runs"] if "bench_runs" in self.at.session_state else 0
+        action(self.at).run()
+        runs = self.at.session_state["bench_runs"] - before
+        self.runs += runs
+        self.bytes += runs * tree_bytes(self.at._tree)
+
+
+def diagnose_buttons() -> Session:
+    s = Session("buttons")
+    s.step(lambda at: at)
+    for key, v in VALUES.items():
+        s.step(lambda at: at.button(key=f"btn_{key}_{v}").click())
+    s.step(lambda at: at.button(key="btn_right_香りを楽しむ人へ").click())
+    s.step(lambda at: at.button(key="btn_submit_full").click())
+    return s
+
+
+def diagnose_compact() -> Session:
+    s = Session("compact")
+    s.step(lambda at: at)
+    # フォーム内の選択はブラウザ側に溜まるだけでサーバは実行しない．完了で1回だけ送られる
+    for key, v in VALUES.items():
+        s.at.segmented_control(key=f"seg_{key}").set_value(v)
+    s.step(lambda at: at.button(key="btn_submit_compact").click())
+    return s
+
+
+def main():
+    results = {"buttons": diagnose_buttons(), "compact": diagnose_compact()}
+    for name, s in results.items():
+        prefs = s.at.session_state["user_preferences"] if "user_preferences" in s.at.session_state else None
+        assert prefs and all(prefs[k[4:]] == v for k, v in VALUES.items()), f"{name}: 入力が渡っていない"
+
+    print(f"{'mode':<8} {'runs':>5} {'bytes':>9}")
+    for name, s in results.items():
+        print(f"{name:<8} {s.runs:>5} {s.bytes:>9,}")
+    b, c = results["buttons"], results["compact"]
+    print(f"reduction: runs {1 - c.runs / b.runs:.0%}, bytes {1 - c.bytes / b.bytes:.0%}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
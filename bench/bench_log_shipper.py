@@ -0,0 +1,160 @@
+# bench/bench_log_shipper.py
+"""
+ログ送信を同期 POST（以前の append_simple_log）とバックグラウンド送信器
+（log_shipper）で比べるベンチマーク．
+
+使い方：
+    python bench/bench_log_shipper.py [件数] [APIの遅延ms] [503を返す割合]
+
+手元に簡易なログAPI（http.server）を立て，指定した遅延と失敗率で応答させる．
+呼び出し側が待たされる時間と，flush 後に全件が届いたかを表示する．
+最後に「ログAPIが落ちている間に送ったレコードが，復旧後にスプールから届くか」と
+「常に 503 になるレコードが1件あっても，後続のレコードが届くか（その1件は隔離されるか）」を確かめる．
+"""
+import json
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import requests
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+from http_client import http_connection_stats
+from log_shipper import LogShipper, ShipperSettings
+
+
+class StubLogAPI(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive を有効にする
+    disable_nagle_algorithm = True
+    delay = 0.05
+    fail_rate = 0.0
+    poison = set()  # この session_id のレコードは常に 503 にする
+    received = []
+    lock = threading.Lock()
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        time.sleep(self.delay)
+        records = body if isinstance(body, list) else [body]
+        if random.random() < self.fail_rate or any(r["session_id"] in self.poison for r in records):
+            self.send_response(503)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        with self.lock:
+            self.received.extend(records)
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"{}")
+
+    def log_message(self, *args):
+        pass
+
+
+def record(i: int) -> dict:
+    return {"user_id": None, "ts": "", "session_id": f"s{i}", "input_json": {"brix": 3}, "result": []}
+
+
+def main(n: int, delay_ms: float, fail_rate: float):
+    StubLogAPI.delay = delay_ms / 1e3
+    StubLogAPI.fail_rate = fail_rate
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubLogAPI)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/log"
+
+    print(f"records: {n}  api delay: {delay_ms:.0f} ms  503 rate: {fail_rate:.0%}")
+    print(f"{'mode':<22} {'caller p50[ms]':>15} {'caller max[ms]':>15} {'delivered':>10} {'total[s]':>9}")
+
+    # 以前の append_simple_log：呼び出しごとに同期 POST（失敗は再送しない）
+    StubLogAPI.received.clear()
+    waits = []
+    t0 = time.perf_counter()
+    for i in range(n):
+        t = time.perf_counter()
+        requests.post(url, json=record(i), headers={"Authorization": "Bearer x"}, timeout=5)
+        waits.append((time.perf_counter() - t) * 1e3)
+    total = time.perf_counter() - t0
+    print(f"{'sync post':<22} {statistics.median(waits):>15.2f} {max(waits):>15.2f} "
+          f"{len(StubLogAPI.received):>10} {total:>9.2f}")
+
+    for batch in (False, True):
+        StubLogAPI.received.clear()
+        shipper = LogShipper(ShipperSettings(url=url, token="x", batch_requests=batch, backoff=0.05))
+        waits = []
+        t0 = time.perf_counter()
+        for i in range(n):
+            t = time.perf_counter()
+            shipper.submit(record(i))
+            waits.append((time.perf_counter() - t) * 1e3)
+        shipper.close(timeout=60)
+        total = time.perf_counter() - t0
+        ids = {r["session_id"] for r in StubLogAPI.received}
+        name = "shipper (batched POST)" if batch else "shipper (per record)"
+        print(f"{name:<22} {statistics.median(waits):>15.3f} {max(waits):>15.3f} "
+              f"{len(ids):>10} {total:>9.2f}")
+        print(f"{'':<22} {shipper.stats()}")
+        print(f"{'':<22} {http_connection_stats()}")
+
+    # ログAPIが落ちている間に送り，復旧後にスプールから replay で届くかを見る
+    StubLogAPI.received.clear()
+    StubLogAPI.fail_rate = 1.0
+    with tempfile.TemporaryDirectory() as tmp:
+        settings = ShipperSettings(
+            url=url, token="x", max_attempts=2, backoff=0.05,
+            spool_path=str(Path(tmp) / "spool.sqlite3"), replay_interval=0.5,
+        )
+        shipper = LogShipper(settings)
+        for i in range(n):
+            shipper.submit(record(i))
+        shipper.flush(timeout=60)
+        print(f"\noutage: delivered {len(StubLogAPI.received)}/{n}  {shipper.stats()}")
+
+        StubLogAPI.fail_rate = 0.0
+        deadline = time.monotonic() + 30
+        while shipper.stats().get("spool_pending") and time.monotonic() < deadline:
+            time.sleep(0.1)
+        ids = {r["session_id"] for r in StubLogAPI.received}
+        print(f"recovered: delivered {len(ids)}/{n}  {shipper.stats()}")
+        shipper.close()
+
+    # 常に 503 になるレコード1件の後に正常なレコードを送る．ログAPIが落ちている判定の
+    # ままで始まっても（前の障害の直後など），後続が届き，503 の1件は隔離されること
+    StubLogAPI.received.clear()
+    StubLogAPI.poison = {"poison"}
+    with tempfile.TemporaryDirectory() as tmp:
+        settings = ShipperSettings(
+            url=url, token="x", max_attempts=2, backoff=0.01,
+            spool_path=str(Path(tmp) / "spool.sqlite3"), replay_interval=0.3, spool_max_attempts=3,
+        )
+        shipper = LogShipper(settings)
+        shipper._down = True
+        shipper.submit(dict(record(0), session_id="poison"))
+        for i in range(5):
+            shipper.submit(record(i))
+        deadline = time.monotonic() + 30
+        while (shipper.stats().get("spool_pending") or shipper._down) and time.monotonic() < deadline:
+            time.sleep(0.1)
+        ids = {r["session_id"] for r in StubLogAPI.received}
+        print(f"\npoison record: delivered {len(ids)}/5  {shipper.stats()}")
+        shipper.close()
+    StubLogAPI.poison = set()
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    main(
+        int(args[0]) if len(args) > 0 else 200,
+        float(args[1]) if len(args) > 1 else 50,
+        float(args[2]) if len(args) > 2 else 0.1,
+    )
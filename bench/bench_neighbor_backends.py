@@ -0,0 +1,57 @@
+# bench/bench_neighbor_backends.py
+"""
+近傍探索バックエンド（brute / kdtree / balltree / grid）の再現率と速度を比べるベンチマーク．
+
+使い方：
+    python bench/bench_neighbor_backends.py [品種数 ...]
+
+R2 には接続せず，約40品種を産地・等級違いで増やした乱数データで計測する．
+再現率は brute の上位3件（同点の並びを含む）と完全に一致した割合である．
+"""
+import sys
+import time
+
+import numpy as np
+
+from synthetic_index import logic, make_index
+
+BACKENDS = ["brute", "kdtree", "balltree", "grid"]
+
+
+def main(sizes):
+    rng = np.random.default_rng(1)
+    queries = rng.integers(1, 7, (300, len(logic.FEATURES)))
+
+    # scikit-learn の import（初回だけ数百ms）を木の構築時間に含めない
+    import sklearn.neighbors  # noqa: F401
+
+    print(f"{'items':>7} {'backend':>9} {'build[ms]':>10} {'single[us]':>11} {'batch[us/q]':>12} {'recall':>7}")
+
+    for n in sizes:
+        index = make_index(n, base_items=40)
+        ref = logic.calculate_topk_batch(queries, k=3, index=index)
+
+        for name in BACKENDS:
+            t0 = time.perf_counter()
+            backend = logic.make_backend(name, index)
+            # 木は重みごとに遅延構築されるので，構築時間に含めるため1回問い合わせておく
+            logic.calculate_topk_batch(queries[:1], k=3, index=index, backend=backend)
+            build_ms = (time.perf_counter() - t0) * 1e3
+
+            t0 = time.perf_counter()
+            got = np.stack([
+                logic.calculate_topk_batch(q[None, :], k=3, index=index, backend=backend)[0]
+                for q in queries
+            ])
+            single_us = (time.perf_counter() - t0) / len(queries) * 1e6
+
+            t0 = time.perf_counter()
+            logic.calculate_topk_batch(queries, k=3, index=index, backend=backend)
+            batch_us = (time.perf_counter() - t0) / len(queries) * 1e6
+
+            recall = float(np.mean(np.all(got == ref, axis=1)))
+            print(f"{n:>7} {name:>9} {build_ms:>10.1f} {single_us:>11.1f} {batch_us:>12.1f} {recall:>7.3f}")
+
+
+if __name__ == "__main__":
+    main([int(a) for a in sys.argv[1:]] or [40, 1_000, 10_000, 50_000])
@@ -0,0 +1,56 @@
+# bench/bench_page_weight.py
+"""
+結果ページの画像部分の重さ（websocket で送る HTML のバイト数）を比べるベンチマーク．
+
+使い方：
+    python bench/bench_page_weight.py
+
+citrus_images/ の全画像について，以前の「元画像をそのまま base64」と，
+image_assets の縮小版（URL 参照／WebP の data URL 埋め込み）を比べる．
+URL 参照ではブラウザが別途取得する画像本体のサイズも併記する．
+"""
+import base64
+import statistics
+import sys
+import time
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+import image_assets
+
+CARDS_PER_PAGE = 3
+
+
+def main():
+    exts = {".jpg", ".jpeg", ".png"}
+    sources = sorted(p for p in (ROOT_DIR / "citrus_images").iterdir() if p.suffix.lower() in exts)
+
+    t0 = time.perf_counter()
+    thumbs = [image_assets.ensure_thumbnails(p) for p in sources]
+    build_s = time.perf_counter() - t0
+
+    original = [len(base64.b64encode(p.read_bytes())) for p in sources]
+    inline_webp = [len(base64.b64encode(webp.read_bytes())) for webp, _ in thumbs]
+    url_ref = [
+        len(f"{image_assets.THUMB_URL}/{webp.name}") + len(f"{image_assets.THUMB_URL}/{fb.name}")
+        for webp, fb in thumbs
+    ]
+    fetched_webp = [webp.stat().st_size for webp, _ in thumbs]
+    fetched_jpeg = [fb.stat().st_size for _, fb in thumbs]
+
+    def page_kib(sizes):
+        return statistics.mean(sizes) * CARDS_PER_PAGE / 1024
+
+    print(f"images: {len(sources)}  thumbnails built in {build_s:.1f}s (width <= {image_assets.THUMB_WIDTH}px)")
+    print(f"{'mode':<26} {'html/page[KiB]':>15} {'fetched/page[KiB]':>18}")
+    print(f"{'original base64':<26} {page_kib(original):>15.1f} {'-':>18}")
+    print(f"{'inline webp (no static)':<26} {page_kib(inline_webp):>15.1f} {'-':>18}")
+    print(f"{'static url (webp)':<26} {page_kib(url_ref):>15.2f} {page_kib(fetched_webp):>18.1f}")
+    print(f"{'static url (jpeg fallback)':<26} {page_kib(url_ref):>15.2f} {page_kib(fetched_jpeg):>18.1f}")
+
+
+if __name__ == "__main__":
+    main()
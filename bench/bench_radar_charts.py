@@ -0,0 +1,55 @@
+# bench/bench_radar_charts.py
+"""
+レーダーチャートの描き方（matplotlib の PNG と手組みの SVG）ごとに，
+1枚あたりの作成時間とカードに埋め込むバイト数を比べるベンチマーク．
+
+使い方：
+    python bench/bench_radar_charts.py [枚数]
+
+PNG はディスクのキャッシュを使わず毎回描く（キャッシュが無いときのコスト）．
+"""
+import base64
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+import radar_charts
+
+
+def main(n: int):
+    rng = np.random.default_rng(0)
+    samples = [tuple(v) for v in rng.integers(1, 7, (n, len(radar_charts.RADAR_LABELS))).tolist()]
+
+    t0 = time.perf_counter()
+    import matplotlib.figure  # noqa: F401  PNG 版だけが払う import コスト
+    import_ms = (time.perf_counter() - t0) * 1e3
+
+    results = {}
+    for name, make in (
+        ("png", lambda v: "data:image/png;base64,"
+            + base64.b64encode(radar_charts.render_radar_png(v, radar_charts.RADAR_TITLE)).decode()),
+        ("svg", lambda v: radar_charts.radar_svg_data_url(v)),
+    ):
+        times, sizes = [], []
+        for v in samples:
+            t0 = time.perf_counter()
+            url = make(v)
+            times.append((time.perf_counter() - t0) * 1e3)
+            sizes.append(len(url.encode("utf-8")))
+        results[name] = (statistics.median(times), statistics.mean(sizes))
+
+    print(f"charts: {n}  (matplotlib import: {import_ms:.0f} ms, PNG only)")
+    print(f"{'backend':>8} {'median[ms]':>11} {'bytes/card':>11}")
+    for name, (ms, size) in results.items():
+        print(f"{name:>8} {ms:>11.2f} {size:>11.0f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 30)
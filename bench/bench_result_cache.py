@@ -0,0 +1,66 @@
+# bench/bench_result_cache.py
+"""
+推薦結果のメモ（ResultCache）のヒット率と1件あたりの時間を測るベンチマーク．
+
+使い方：
+    python bench/bench_result_cache.py [品種数] [リクエスト数] [Zipf の指数]
+
+R2 には接続せず，乱数で作った柑橘データで計測する．嗜好ベクトルは
+6**6 通りから Zipf 分布で選ぶ（よく選ばれる組み合わせに偏るアクセスを想定）．
+途中で版を変えて，古い結果が捨てられることも確認する．
+"""
+import sys
+import time
+
+import numpy as np
+
+from synthetic_index import logic, make_index
+
+
+def main(n_items: int, n_requests: int, zipf_a: float):
+    index = make_index(n_items)
+    w = logic._feature_weights(None)
+    rng = np.random.default_rng(1)
+
+    # よく選ばれる順に並べた嗜好ベクトルから Zipf 分布で選ぶ
+    popular = logic.all_preferences()[rng.permutation(logic.PREF_LEVELS ** len(logic.FEATURES))]
+    picks = np.minimum(rng.zipf(zipf_a, n_requests) - 1, len(popular) - 1)
+    queries = popular[picks]
+
+    def live(q):
+        return logic.calculate_topk_batch(q[None, :], k=3, index=index)[0].tolist()
+
+    t0 = time.perf_counter()
+    expected = [live(q) for q in queries]
+    live_us = (time.perf_counter() - t0) / n_requests * 1e6
+
+    cache = logic.ResultCache(max_entries=4096, ttl=3600)
+    t0 = time.perf_counter()
+    got = []
+    for q in queries:
+        key = cache.make_key(None, "v1", q, w)
+        ids = cache.get(key)
+        if ids is None:
+            ids = tuple(live(q))
+            cache.put(key, ids)
+        got.append(list(ids))
+    memo_us = (time.perf_counter() - t0) / n_requests * 1e6
+    assert got == expected, "メモの結果がその場の計算と一致しない"
+
+    print(f"items: {n_items}  requests: {n_requests}  zipf a: {zipf_a}  distinct: {len(set(picks.tolist()))}")
+    print(f"live  : {live_us:8.1f} us/call")
+    print(f"memo  : {memo_us:8.1f} us/call  ({live_us / memo_us:.1f}x)")
+    print(f"stats : {cache.stats()}")
+
+    # 版が変わったら古い結果は使われない
+    cache.get(cache.make_key(None, "v2", queries[0], w))
+    print(f"after version change: {cache.stats()}")
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    main(
+        int(args[0]) if len(args) > 0 else 500,
+        int(args[1]) if len(args) > 1 else 20000,
+        float(args[2]) if len(args) > 2 else 1.3,
+    )
@@ -0,0 +1,63 @@
+# bench/bench_trace_overhead.py
+"""
+perf_trace のスパン計測1回あたりの負担を，無効・有効のそれぞれで測るベンチマーク．
+
+使い方：
+    python bench/bench_trace_overhead.py [呼び出し回数]
+
+何もしない関数を
+
+- そのまま呼ぶ（基準）
+- @traced を付けて呼ぶ
+- with span(...) の中で呼ぶ
+
+の3通りで呼び，基準との差を1回あたりのナノ秒で出す．
+"""
+import sys
+import time
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+import perf_trace
+from perf_trace import span, traced
+
+
+def noop():
+    return None
+
+
+traced_noop = traced("noop")(noop)
+
+
+def per_call_ns(fn, n: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - t0) / n * 1e9
+
+
+def with_span():
+    with span("noop"):
+        noop()
+
+
+def main(n: int):
+    rows = []
+    for enabled in (False, True):
+        perf_trace.configure(enabled=enabled, buffer_size=perf_trace.DEFAULT_BUFFER_SIZE)
+        base = per_call_ns(noop, n)
+        rows.append((enabled, "@traced", per_call_ns(traced_noop, n) - base))
+        rows.append((enabled, "span()", per_call_ns(with_span, n) - base))
+    perf_trace.configure(enabled=False)
+
+    print(f"calls: {n}")
+    print(f"{'enabled':<8} {'api':<8} {'overhead[ns/call]':>18}")
+    for enabled, api, ns in rows:
+        print(f"{str(enabled):<8} {api:<8} {ns:>18.0f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200_000)
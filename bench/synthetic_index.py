@@ -0,0 +1,46 @@
+# bench/synthetic_index.py
+"""
+ベンチマークで共有する，乱数で作った柑橘データの CitrusIndex．
+
+R2 には接続しない．各ベンチからは
+
+    from synthetic_index import logic, make_index
+
+として使う（bench/ はスクリプトとして実行するので，このディレクトリが sys.path に入る）．
+"""
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+from page_registry import load_page
+
+logic = load_page("pages/2_calculation_logic.py")
+
+
+def make_index(n_items: int, seed: int = 0, base_items: int | None = None):
+    """
+    n_items 行の CitrusIndex を作る．
+
+    base_items を省略すると各軸1〜6の一様乱数．指定すると base_items 品種を基準に，
+    各軸 ±1 の揺らぎを入れた行を作る（産地・等級違いで同じような品種が増えた場合）．
+    """
+    rng = np.random.default_rng(seed)
+    n_features = len(logic.FEATURES)
+    if base_items is None:
+        rows = rng.integers(1, 7, (n_items, n_features))
+    else:
+        base = rng.integers(1, 7, (base_items, n_features))
+        rows = base[rng.integers(0, base_items, n_items)] + rng.integers(-1, 2, (n_items, n_features))
+        rows = np.clip(rows, 1, 6)
+
+    df = pd.DataFrame(rows, columns=logic.FEATURES)
+    df["name"] = [f"item_{i}" for i in range(n_items)]
+    df["id"] = np.arange(1, n_items + 1)
+    df["season"] = ""
+    return logic.CitrusIndex.from_dataframe(df, version="bench")
@@ -0,0 +1,277 @@
+# catalogue.py
+"""
+柑橘カタログ（特徴量CSV＋詳細XLSX）をプロセスで1つだけ持つ層．
+
+以前は推薦計算と結果ページ（ログイン有無の2ページ）がそれぞれ特徴量CSVを
+取得・パースし，詳細XLSXも結果ページごとに読んでいた．ここでは
+
+- 特徴量CSVは1回だけ読み，カラム名を標準化した DataFrame を推薦計算と結果ページで共有する
+- 詳細XLSXも1回だけ読み，Item_ID で特徴量と結合した items を作る
+- 結果カードの描画用に Item_ID → CatalogueItem の辞書（by_id）も版ごとに1回だけ作る
+
+ので，R2 への取得と保持するデータはそれぞれ1つで済む．
+
+詳細XLSXのパース（openpyxl）は起動直後で最も遅い処理なので，一度パースした
+結果を内容のハッシュをキーに .cache/datasets へ Parquet で保存し，次回の起動からは
+それを読む．
+
+secrets.toml の項目：
+    r2_key         : 特徴量CSVのオブジェクトキー（既定 citrus_features.csv）
+    r2_details_key : 詳細XLSXのオブジェクトキー（既定 citrus_details_list.xlsx）
+"""
+import hashlib
+import os
+from io import BytesIO
+from pathlib import Path
+from typing import List, NamedTuple
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from perf_trace import traced
+from r2_datasets import load_dataset
+
+# 柑橘の特徴量として使うカラム名
+FEATURES = ["brix", "acid", "bitterness", "aroma", "moisture", "texture"]
+
+# 入力CSVの別名 → 標準名マッピング
+ALIASES = {
+    "brix": ["brix", "sweet", "sweetness", "sugar"],
+    "acid": ["acid", "acidity", "sour", "sourness"],
+    "bitterness": ["bitterness", "bitter"],
+    "aroma": ["aroma", "smell", "fragrance", "flavor", "flavour"],
+    "moisture": ["moisture", "juicy", "juiciness"],
+    "texture": ["texture", "elastic", "firmness", "pulpiness"],
+}
+
+DEFAULT_FEATURES_KEY = "citrus_features.csv"
+DEFAULT_DETAILS_KEY = "citrus_details_list.xlsx"
+DETAILS_SHEET = "description_image"
+
+# パース済みデータセットの置き場所．_read_details_xlsx の出力を変えたら DETAILS_CACHE_FORMAT を上げる
+DATASET_CACHE_DIR = Path(__file__).resolve().parent / ".cache" / "datasets"
+DETAILS_CACHE_FORMAT = 1
+
+
+def _standardize_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """CSVのカラム名を標準化し，idカラムを補完する．"""
+    # 小文字化＆前後の空白除去
+    df = df.rename(columns={c: c.strip().lower() for c in df.columns})
+
+    # season を推定
+    if "season" not in df.columns:
+        for cand in ["seasons", "season_pref", "in_season"]:
+            if cand in df.columns:
+                df = df.rename(columns={cand: "season"})
+                break
+
+    # 特徴量の別名を標準名へ
+    for std, cands in ALIASES.items():
+        if std in df.columns:
+            continue
+        for cand in cands:
+            if cand in df.columns:
+                df = df.rename(columns={cand: std})
+                break
+
+    # name / id を補完
+    if "name" not in df.columns:
+        for cand in ["品種名", "citrus_name", "item_name", "title"]:
+            if cand in df.columns:
+                df = df.rename(columns={cand: "name"})
+                break
+        if "name" not in df.columns:
+            df["name"] = [f"item_{i}" for i in range(len(df))]
+
+    # 詳細XLSXと同じ Item_ID があればそれを id とする（無ければ行番号）
+    if "id" not in df.columns:
+        if "item_id" in df.columns:
+            df["id"] = pd.to_numeric(df["item_id"], errors="coerce")
+            df = df.dropna(subset=["id"])
+            df["id"] = df["id"].astype(np.int64)
+        else:
+            df["id"] = np.arange(1, len(df) + 1)
+
+    return df
+
+
+def parse_seasons(cell: str) -> List[str]:
+    """seasonセルをカンマ区切りで分割し，小文字リストにする．"""
+    if not cell:
+        return []
+    return [s.strip().lower() for s in str(cell).split(",") if s.strip()]
+
+
+def _parse_features_csv(body: bytes) -> pd.DataFrame:
+    """特徴量CSVを読み込み，特徴量と season 等を整えた DataFrame を返す．"""
+    df = pd.read_csv(BytesIO(body), encoding="utf-8-sig")
+    df = _standardize_columns(df)
+
+    # 必須カラム確認
+    missing = [c for c in FEATURES if c not in df.columns]
+    if missing:
+        raise KeyError(f"必要カラムが見つからない: {missing} / 取得カラム: {list(df.columns)}")
+
+    # 数値化して1〜6にクリップ
+    for col in FEATURES:
+        df[col] = pd.to_numeric(df[col], errors="coerce").clip(1, 6)
+
+    # season を文字列で用意
+    if "season" not in df.columns:
+        df["season"] = ""
+    df["season"] = df["season"].fillna("").astype(str)
+
+    # 特徴量に欠損がある行は落とす
+    return df.dropna(subset=FEATURES).reset_index(drop=True)
+
+
+def _read_details_xlsx(body: bytes) -> pd.DataFrame:
+    """詳細XLSX（名前・説明文・画像キー）を読み込む．"""
+    df = pd.read_excel(BytesIO(body), sheet_name=DETAILS_SHEET)
+    if "Item_ID" in df.columns:
+        df["Item_ID"] = pd.to_numeric(df["Item_ID"], errors="coerce")
+    return df
+
+
+def details_cache_path(body: bytes) -> Path:
+    digest = hashlib.sha256(body).hexdigest()[:32]
+    return DATASET_CACHE_DIR / f"details_{digest}_v{DETAILS_CACHE_FORMAT}.parquet"
+
+
+def _parse_details_xlsx(body: bytes) -> pd.DataFrame:
+    """
+    詳細XLSXを読み込む．同じ内容を以前パースしていればディスク上の Parquet を使う．
+
+    保存に失敗しても（読み取り専用の環境など）パース結果はそのまま返す．
+    """
+    path = details_cache_path(body)
+    if path.exists():
+        try:
+            return pd.read_parquet(path)
+        except (OSError, ValueError):
+            pass
+
+    df = _read_details_xlsx(body)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        df.to_parquet(tmp, index=False)
+        os.replace(tmp, path)
+        # 古い版のキャッシュは残さない
+        for old in path.parent.glob("details_*.parquet"):
+            if old != path:
+                old.unlink(missing_ok=True)
+    except (OSError, ValueError, TypeError, ImportError):
+        pass
+    return df
+
+
+def features_key(key: str | None = None) -> str:
+    return key or st.secrets.get("r2_key") or DEFAULT_FEATURES_KEY
+
+
+def details_key(key: str | None = None) -> str:
+    return key or st.secrets.get("r2_details_key") or DEFAULT_DETAILS_KEY
+
+
+@traced()
+def load_features(key: str | None = None):
+    """
+    標準化済みの特徴量を r2_datasets.Dataset として返す．
+
+    推薦計算はこれだけを使うので，詳細XLSXの取得を待たない．
+    data は全セッションで共有されるので書き換えないこと．
+    """
+    return load_dataset(features_key(key), _parse_features_csv)
+
+
+@traced()
+def load_details(key: str | None = None):
+    """詳細XLSXを r2_datasets.Dataset として返す（共有データなので書き換えないこと）．"""
+    return load_dataset(details_key(key), _parse_details_xlsx)
+
+
+class CatalogueItem(NamedTuple):
+    """
+    結果カード1枚分の品種情報（タプルなので1件あたりのメモリは小さい）．
+
+    - image_key: 詳細XLSXの Image_key（リポジトリ直下からの相対パス．無ければ空文字）
+    - features : FEATURES の並びの6値（特徴量CSVに無い品種は None）
+    """
+
+    item_id: int
+    name: str
+    description: str
+    image_key: str
+    features: tuple | None
+
+
+class Catalogue(NamedTuple):
+    """
+    カタログ全体．いずれの DataFrame・辞書も全セッションで共有されるので書き換えないこと．
+
+    - version : 特徴量と詳細の版（ETag）を繋げたもの
+    - features: 標準化済みの特徴量（推薦計算と同じもの）
+    - details : 詳細XLSXそのもの
+    - items   : 詳細に FEATURES を Item_ID で結合したもの（Item_ID が index）
+    - by_id   : Item_ID → CatalogueItem（結果ページはこれだけを引く）
+    """
+
+    version: str
+    features: pd.DataFrame
+    details: pd.DataFrame
+    items: pd.DataFrame
+    by_id: dict
+
+
+@st.cache_resource(max_entries=4, show_spinner=False)
+def _join_items(version: str, _features: pd.DataFrame, _details: pd.DataFrame) -> pd.DataFrame:
+    """版ごとに1回だけ詳細と特徴量を結合する（DataFrame 引数はハッシュしない）．"""
+    details = _details.dropna(subset=["Item_ID"]).drop_duplicates("Item_ID")
+    details = details.set_index(details["Item_ID"].astype(np.int64).rename(None))
+    feats = _features.drop_duplicates("id").set_index("id")[FEATURES]
+    return details.join(feats, how="left")
+
+
+def _text_column(df: pd.DataFrame, *names: str) -> list:
+    """names のうち最初にあるカラムを文字列のリストで返す（欠損は空文字）．"""
+    for name in names:
+        if name in df.columns:
+            return ["" if pd.isna(v) else str(v) for v in df[name]]
+    return [""] * len(df)
+
+
+@st.cache_resource(max_entries=4, show_spinner=False)
+def _index_items(version: str, _items: pd.DataFrame) -> dict:
+    """版ごとに1回だけ items から Item_ID → CatalogueItem の辞書を作る．"""
+    feats = _items[FEATURES].to_numpy(dtype=float)
+    complete = ~np.isnan(feats).any(axis=1)
+    rows = zip(
+        _items.index.tolist(),
+        _text_column(_items, "Item_name", "name"),
+        _text_column(_items, "Description", "description"),
+        _text_column(_items, "Image_key"),
+        feats.tolist(),
+        complete.tolist(),
+    )
+    return {
+        iid: CatalogueItem(iid, name, desc, image_key, tuple(int(v) for v in f) if ok else None)
+        for iid, name, desc, image_key, f, ok in rows
+    }
+
+
+@traced()
+def load_catalogue(features: str | None = None, details: str | None = None) -> Catalogue:
+    """特徴量・詳細それぞれの現在の版から作ったカタログを返す．"""
+    f = load_features(features)
+    d = load_details(details)
+    version = f"{f.version}|{d.version}"
+    items = _join_items(version, f.data, d.data)
+    return Catalogue(
+        version=version,
+        features=f.data,
+        details=d.data,
+        items=items,
+        by_id=_index_items(version, items),
+    )
@@ -0,0 +1,193 @@
+# http_client.py
+"""
+外部への HTTP 呼び出し（ログAPI・LINE のトークン交換）で共有する requests.Session．
+
+以前は各所がモジュールレベルの requests.post を呼んでいたため，呼び出しごとに
+TCP/TLS 接続を張り直していた．ここでは接続プール付きの Session を1つだけ作り，
+全スレッド・全セッションで使い回す（urllib3 がホストごとにプールを持ち，keep-alive で再利用する）．
+
+- タイムアウトを指定しない呼び出しにも既定のタイムアウトを付ける
+- 接続エラーはどのメソッドでも再試行する（リクエストはまだ送られていない）
+- 読み込みエラーと 429/502/503/504 は GET などの冪等なメソッドだけ再試行する
+  （POST のトークン交換やログ送信は二重に送らない．ログの再送は log_shipper が行う）
+- ホストごとの件数・エラー数・所要時間を数える（http_connection_stats）
+
+secrets.toml で調整できる項目（いずれも省略可）：
+    http_pool_maxsize      : ホストごとの接続プールの上限（既定 10）
+    http_retries           : 再試行の回数（既定 2）
+    http_connect_timeout   : 接続タイムアウト秒（既定 3.05）
+    http_read_timeout      : 読み込みタイムアウト秒（既定 10）
+
+requests は最初の呼び出しのときに読み込む（トップ・入力ページの起動を軽くする）．
+"""
+import threading
+import time
+from urllib.parse import urlsplit
+
+import streamlit as st
+
+from metrics import histogram
+
+_LOCK = threading.Lock()
+_SESSIONS = {}
+_HOSTS = {}
+_HTTP_SECONDS = histogram(
+    "http_request_seconds", "共通 Session でのリクエストの所要時間（result は ok / http_error / error）",
+    ("host", "result"),
+)
+
+
+def _setting(name: str, default):
+    try:
+        return st.secrets.get(name, default)
+    except FileNotFoundError:  # secrets.toml が無い（ベンチなど）ときは既定値
+        return default
+
+
+def _settings() -> tuple:
+    return (
+        int(_setting("http_pool_maxsize", 10)),
+        int(_setting("http_retries", 2)),
+        float(_setting("http_connect_timeout", 3.05)),
+        float(_setting("http_read_timeout", 10)),
+    )
+
+
+def get_http_session():
+    """
+    プロセス共通の requests.Session を返す．
+
+    プールや再試行の設定が変わったときだけ作り直す（古い Session は閉じない）．
+    """
+    settings = _settings()
+    session = _SESSIONS.get(settings)
+    if session is not None:
+        return session
+
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    with _LOCK:
+        session = _SESSIONS.get(settings)
+        if session is not None:
+            return session
+
+        pool, retries, connect_timeout, read_timeout = settings
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=retries,
+            backoff_factor=0.3,
+            status_forcelist=(429, 502, 503, 504),
+            allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=pool, pool_maxsize=pool, max_retries=retry)
+        session = requests.Session()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.default_timeout = (connect_timeout, read_timeout)
+
+        # 古い Session は閉じずに手放すだけにする．ログ送信のスレッドなどが送信中かもしれないので，
+        # 使っている呼び出しが参照を離したあと，urllib3 のプールが GC 時に接続を閉じる
+        _SESSIONS.clear()
+        _SESSIONS[settings] = session
+
+    return session
+
+
+def _record(host: str, elapsed: float, status: int | None) -> None:
+    result = "error" if status is None else "http_error" if status >= 400 else "ok"
+    _HTTP_SECONDS.observe(elapsed, host=host, result=result)
+    with _LOCK:
+        s = _HOSTS.setdefault(
+            host, {"requests": 0, "errors": 0, "http_errors": 0, "total_ms": 0.0, "max_ms": 0.0}
+        )
+        s["requests"] += 1
+        if status is None:
+            s["errors"] += 1
+        elif status >= 400:
+            s["http_errors"] += 1
+        ms = elapsed * 1e3
+        s["total_ms"] += ms
+        s["max_ms"] = max(s["max_ms"], ms)
+
+
+def _host_key(url: str) -> str:
+    parts = urlsplit(url)
+    port = parts.port or (443 if parts.scheme == "https" else 80)
+    return f"{parts.hostname}:{port}"
+
+
+def request(method: str, url: str, timeout=None, **kwargs):
+    """
+    共通の Session でリクエストを送る．引数は requests.request と同じ．
+
+    timeout を省略したときは (http_connect_timeout, http_read_timeout) を使う．
+    """
+    session = get_http_session()
+    if timeout is None:
+        timeout = session.default_timeout
+
+    host = _host_key(url)
+    t0 = time.perf_counter()
+    try:
+        response = session.request(method, url, timeout=timeout, **kwargs)
+    except Exception:
+        _record(host, time.perf_counter() - t0, None)
+        raise
+    _record(host, time.perf_counter() - t0, response.status_code)
+    return response
+
+
+def get(url: str, **kwargs):
+    return request("GET", url, **kwargs)
+
+
+def post(url: str, **kwargs):
+    return request("POST", url, **kwargs)
+
+
+def _open_pools(session) -> dict:
+    """Session 内部の urllib3 接続プールをホストごとに返す（取得できなければ空）．"""
+    pools = {}
+    for adapter in set(session.adapters.values()):
+        try:
+            manager = adapter.poolmanager
+            for key in manager.pools.keys():
+                pools[f"{key.key_host}:{key.key_port}"] = manager.pools[key]
+        except (AttributeError, KeyError):
+            continue
+    return pools
+
+
+def http_connection_stats() -> dict:
+    """
+    ホストごとの呼び出し状況を返す．
+
+    requests        : 呼び出し数（urllib3 内部の再試行は1回と数える）
+    errors          : 例外（接続エラー・タイムアウト）で終わった数
+    http_errors     : 4xx/5xx が返った数
+    avg_ms / max_ms : 所要時間（再試行の待ちを含む）
+    new_connections : そのホストに新しく張った TCP/TLS 接続の数
+    """
+    with _LOCK:
+        hosts = {h: dict(s) for h, s in _HOSTS.items()}
+        sessions = list(_SESSIONS.values())
+
+    connections = {}
+    for session in sessions:
+        for host, pool in _open_pools(session).items():
+            connections[host] = connections.get(host, 0) + getattr(pool, "num_connections", 0)
+
+    stats = {}
+    for host, s in hosts.items():
+        total_ms = s.pop("total_ms")
+        s["avg_ms"] = round(total_ms / s["requests"], 1) if s["requests"] else 0.0
+        s["max_ms"] = round(s["max_ms"], 1)
+        s["new_connections"] = connections.get(host, 0)
+        stats[host] = s
+    return stats
@@ -0,0 +1,170 @@
+# image_assets.py
+"""
+結果ページに載せる画像（品種写真・no-image・背景）の縮小版を作って配信する層．
+
+以前は citrus_images/ の元画像（1枚 1〜2MB）をそのまま base64 にしてカードの HTML に
+埋め込んでいたため，結果ページ1回で数MBが websocket を流れていた．ここでは
+
+- 表示幅の2倍（THUMB_WIDTH）までに縮小し，WebP と JPEG（透過があれば PNG）で再圧縮する
+- 縮小版は元画像の内容ハッシュをファイル名にして static/thumbs/ に1回だけ保存する
+- Streamlit の静的配信（.streamlit/config.toml の server.enableStaticServing）が有効なら
+  URL で参照し，無効なら小さくなった WebP を data URL で埋め込む
+
+ので，カード1枚あたりの転送量は数十KB以下になる．
+"""
+import base64
+import hashlib
+import html
+import os
+import threading
+from pathlib import Path
+from typing import NamedTuple
+
+import streamlit as st
+
+from metrics import CACHE_LOOKUPS, IMAGE_PAYLOAD_BYTES
+
+ROOT_DIR = Path(__file__).resolve().parent
+
+# 縮小版の設定．変えたときは THUMB_FORMAT も上げて作り直させる
+THUMB_WIDTH = 640
+WEBP_QUALITY = 78
+JPEG_QUALITY = 82
+THUMB_FORMAT = 1
+
+# Streamlit は app.py と同じ階層の static/ を app/static/ として配信する
+STATIC_DIR = ROOT_DIR / "static"
+THUMB_DIR = STATIC_DIR / "thumbs"
+THUMB_URL = "app/static/thumbs"
+
+
+class ImageAsset(NamedTuple):
+    """<img> に使う参照先．webp が空なら fallback だけを使う．"""
+
+    webp: str
+    fallback: str
+
+
+_LOCK = threading.Lock()
+_DIGESTS = {}
+
+
+def _source_digest(path: Path) -> str:
+    """元画像の内容ハッシュ．同じファイル（パス・更新時刻・サイズ）なら読み直さない．"""
+    st_ = path.stat()
+    memo_key = (str(path), st_.st_mtime_ns, st_.st_size)
+    digest = _DIGESTS.get(memo_key)
+    if digest is None:
+        digest = hashlib.sha256(path.read_bytes()).hexdigest()[:24]
+        _DIGESTS[memo_key] = digest
+    return digest
+
+
+def _save_atomic(img, path: Path, fmt: str, **params) -> None:
+    tmp = path.with_suffix(f".{os.getpid()}.tmp")
+    img.save(tmp, format=fmt, **params)
+    os.replace(tmp, path)
+
+
+def _existing_thumbnails(stem: str) -> tuple[Path, Path] | None:
+    """作成済みの縮小版（WebP とフォールバック）があればそのパスを返す．"""
+    webp_path = THUMB_DIR / f"{stem}.webp"
+    for fallback_path in (THUMB_DIR / f"{stem}.jpg", THUMB_DIR / f"{stem}.png"):
+        if webp_path.exists() and fallback_path.exists():
+            return webp_path, fallback_path
+    return None
+
+
+def ensure_thumbnails(path: Path, width: int = THUMB_WIDTH) -> tuple[Path, Path]:
+    """
+    path の縮小版（WebP とフォールバック用の JPEG/PNG）を作り，そのパスを返す．
+
+    既に同じ内容から作ったものがあればそのまま返す．元画像より大きくはしない．
+    """
+    stem = f"{_source_digest(path)}_w{width}_v{THUMB_FORMAT}"
+    webp_path = THUMB_DIR / f"{stem}.webp"
+    existing = _existing_thumbnails(stem)
+    if existing is not None:
+        CACHE_LOOKUPS.inc(cache="thumbnails", result="hit")
+        return existing
+    CACHE_LOOKUPS.inc(cache="thumbnails", result="miss")
+
+    # Pillow は縮小版を作るときだけ読み込む（作成済みなら import しない）
+    from PIL import Image, ImageOps
+
+    with _LOCK:
+        # ロックを待つ間に別のセッションが作っていれば，それを使う
+        existing = _existing_thumbnails(stem)
+        if existing is not None:
+            return existing
+
+        with Image.open(path) as src:
+            # スマホ写真の向き（EXIF）を画素に反映してからメタデータごと落とす
+            img = ImageOps.exif_transpose(src)
+            img.thumbnail((width, width * 4), Image.Resampling.LANCZOS)
+
+        has_alpha = img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info)
+        img = img.convert("RGBA" if has_alpha else "RGB")
+
+        THUMB_DIR.mkdir(parents=True, exist_ok=True)
+        _save_atomic(img, webp_path, "WEBP", quality=WEBP_QUALITY, method=6)
+        if has_alpha:
+            fallback_path = THUMB_DIR / f"{stem}.png"
+            _save_atomic(img, fallback_path, "PNG", optimize=True)
+        else:
+            fallback_path = THUMB_DIR / f"{stem}.jpg"
+            _save_atomic(img, fallback_path, "JPEG", quality=JPEG_QUALITY, optimize=True, progressive=True)
+
+    return webp_path, fallback_path
+
+
+def static_serving_enabled() -> bool:
+    return bool(st.get_option("server.enableStaticServing"))
+
+
+@st.cache_data(show_spinner=False, max_entries=256)
+def _inline_data_url(path: str) -> str:
+    """縮小版のファイルを data URL にする（ファイル名が内容ハッシュなので path だけで引ける）．"""
+    p = Path(path)
+    mime = {".webp": "image/webp", ".png": "image/png"}.get(p.suffix.lower(), "image/jpeg")
+    return f"data:{mime};base64,{base64.b64encode(p.read_bytes()).decode('utf-8')}"
+
+
+def image_asset(path: Path, width: int = THUMB_WIDTH) -> ImageAsset | None:
+    """
+    path の画像をカードに載せるための参照先を返す．
+
+    画像が無い・読めない場合は None．縮小版を書き込めない環境では元画像の
+    data URL を返す（以前と同じ挙動）．
+    """
+    path = Path(path)
+    if not path.exists():
+        return None
+    try:
+        webp_path, fallback_path = ensure_thumbnails(path, width)
+    except OSError:
+        try:
+            return _observed(ImageAsset(webp="", fallback=_inline_data_url(str(path))), "original")
+        except OSError:
+            return None
+
+    if static_serving_enabled():
+        return _observed(ImageAsset(
+            webp=f"{THUMB_URL}/{webp_path.name}",
+            fallback=f"{THUMB_URL}/{fallback_path.name}",
+        ), "static")
+    return _observed(ImageAsset(webp="", fallback=_inline_data_url(str(webp_path))), "inline")
+
+
+def _observed(asset: ImageAsset, delivery: str) -> ImageAsset:
+    """カードに載る参照の大きさを metrics に記録して，そのまま返す．"""
+    IMAGE_PAYLOAD_BYTES.observe(len(asset.webp) + len(asset.fallback), kind="photo", delivery=delivery)
+    return asset
+
+
+def picture_html(asset: ImageAsset, style: str, alt: str = "") -> str:
+    """ImageAsset を1行の HTML にする．WebP を読めないブラウザには fallback を出す．"""
+    img = f'<img src="{asset.fallback}" alt="{html.escape(alt)}" loading="lazy" style="{style}">'
+    if not asset.webp:
+        return img
+    return f'<picture><source srcset="{asset.webp}" type="image/webp">{img}</picture>'
@@ -0,0 +1,416 @@
+# log_shipper.py
+"""
+D1 ログAPIへの送信をリクエスト処理から切り離すバックグラウンド送信器．
+
+以前は append_simple_log が診断ボタンの処理の中で requests.post(timeout=5) を
+同期で呼んでいたため，ログAPIが遅いとそのまま診断結果の表示が最大5秒遅れた．
+ここでは
+
+- append_simple_log はレコードを上限付きのキューに入れるだけで戻る
+- ワーカースレッドがキューからまとめて取り出して送る
+- 失敗（接続エラー・429・5xx）は指数バックオフで再送し，上限を超えたらスプールに残す
+- 4xx はそのレコードだけの問題として扱い，再送せずにスプール上で rejected にする
+- プロセス終了時（atexit）にキューに残った分を送り切る
+
+レコードはキューに入れる前に log_spool（SQLite）へ書き込み，送れた行だけ消す．
+接続できなかったとき，または再送しても 429/5xx のレコードが DOWN_AFTER_FAILURES 件続いたときは
+「ログAPIが落ちている」とみなして以降の送信を止め，replay_interval ごとにスプールに残った行を
+古い順にまとめて送り直す（replay）．replay は失敗した行を飛ばして先へ進み，どれか1件でも
+送れたら送信を再開する．log_spool_max_attempts 回送れなかった行は隔離して，以降は送らない．
+プロセスが落ちても，スプールに残った行は次のプロセスが起動後に送る．
+
+secrets.toml で調整できる項目（いずれも省略可）：
+    log_queue_max      : キューの上限（既定 1000．溢れた分はスプールから replay で送る）
+    log_batch_size     : 1回に取り出す最大件数（既定 20）
+    log_batch_requests : true なら1回の POST で JSON 配列としてまとめて送る
+                         （既定 false．ログAPIが1件ずつしか受けない場合は1件ずつ POST する）
+    log_max_attempts   : 再送を含めた最大試行回数（既定 5）
+    log_spool_path     : スプールのパス（既定 .cache/log_spool.sqlite3．空文字ならスプールを使わない）
+    log_replay_interval: スプールを見直す間隔（秒，既定 60）
+    log_spool_max_attempts: スプールの1行を送ってみる最大回数（既定 5．超えたら隔離する）
+"""
+import atexit
+import queue
+import random
+import sqlite3
+import threading
+import time
+from typing import NamedTuple
+
+import streamlit as st
+
+import http_client
+from metrics import counter, register_collector
+from log_spool import DEFAULT_SPOOL_PATH, LogSpool
+
+
+class ShipperSettings(NamedTuple):
+    url: str
+    token: str
+    queue_max: int = 1000
+    batch_size: int = 20
+    batch_requests: bool = False
+    max_attempts: int = 5
+    timeout: float = 5.0
+    backoff: float = 0.5
+    max_backoff: float = 10.0
+    spool_path: str = ""
+    replay_interval: float = 60.0
+    replay_batch: int = 100
+    spool_max_attempts: int = 5
+
+
+# 429/5xx で送れないレコードがこの件数続いたら，ログAPIが落ちているとみなす
+DOWN_AFTER_FAILURES = 3
+
+
+class _RetryableError(Exception):
+    """再送すれば通るかもしれない失敗．unreachable は接続そのものができなかったとき True．"""
+
+    def __init__(self, message: str, unreachable: bool = False):
+        super().__init__(message)
+        self.unreachable = unreachable
+
+
+class LogShipper:
+    """上限付きキューとワーカースレッド1本でログを送る．"""
+
+    def __init__(self, settings: ShipperSettings):
+        self.settings = settings
+        self._queue = queue.Queue(maxsize=settings.queue_max)
+        self._stop = threading.Event()
+        self._idle = threading.Condition()
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._stats = {
+            "enqueued": 0,
+            "dropped": 0,
+            "sent": 0,
+            "requests": 0,
+            "retries": 0,
+            "failed": 0,
+            "rejected": 0,
+            "deferred": 0,
+            "replayed": 0,
+            "quarantined": 0,
+            "spool_errors": 0,
+            "last_error": "",
+        }
+        self._spool = None
+        if settings.spool_path:
+            try:
+                self._spool = LogSpool(settings.spool_path)
+            except sqlite3.Error as e:
+                self._bump("spool_errors")
+                self._record_error(e)
+        # ログAPIが落ちていると判断している間は True（キューの分は送らずスプールに任せる）
+        self._down = False
+        self._failures = 0  # 429/5xx で送れなかったレコードの連続件数
+        self._next_replay = 0.0
+        self._replayed_upto = 0
+        self._thread = threading.Thread(target=self._run, name="log-shipper", daemon=True)
+        self._thread.start()
+
+    # ===== 呼び出し側 =====
+
+    def submit(self, record: dict) -> bool:
+        """
+        レコードをスプールに書いてからキューに入れる（送信は待たない）．
+
+        キューが一杯でもスプールに書けていれば後で replay で送るので True を返す．
+        スプールにもキューにも入らなかったときだけ False を返す．
+        """
+        if self._stop.is_set():
+            return False
+        row_id = self._spool_call(lambda s: s.append(record))
+        with self._idle:
+            self._pending += 1
+        try:
+            self._queue.put_nowait((row_id, record))
+        except queue.Full:
+            self._done(1)
+            self._bump("dropped")
+            return row_id is not None
+        self._bump("enqueued")
+        return True
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """キューに入れた分を送り終える（再送を諦めた分を含む）まで待つ．"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._idle:
+            while self._pending:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._idle.wait(remaining)
+        return True
+
+    def close(self, timeout: float = 10.0) -> bool:
+        """新しい受付を止め，残りを送ってからワーカーを止める．"""
+        self._stop.set()
+        flushed = self.flush(timeout)
+        self._thread.join(timeout=1.0)
+        if self._spool is not None and not self._thread.is_alive():
+            self._spool.close()
+        return flushed
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["queued"] = self._queue.qsize()
+        stats["api_down"] = self._down
+        if self._spool is not None:
+            counts = self._spool_call(lambda s: s.counts()) or {}
+            stats.update({f"spool_{k}": v for k, v in counts.items()})
+        return stats
+
+    # ===== ワーカー =====
+
+    def _bump(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self._stats[name] += amount
+        _LOG_EVENTS.inc(amount, event=name)
+
+    def _done(self, n: int) -> None:
+        with self._idle:
+            self._pending -= n
+            if not self._pending:
+                self._idle.notify_all()
+
+    def _spool_call(self, fn):
+        """スプールの操作を行う．スプールが無い・壊れているときは None を返す（送信は続ける）．"""
+        if self._spool is None:
+            return None
+        try:
+            return fn(self._spool)
+        except sqlite3.Error as e:
+            self._bump("spool_errors")
+            self._record_error(e)
+            return None
+
+    def _run(self) -> None:
+        while True:
+            try:
+                first = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                if self._stop.is_set():
+                    return
+                self._replay()
+                continue
+
+            batch = [first]
+            while len(batch) < self.settings.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            try:
+                # replay で送り済みの行は飛ばす（スプールの id は単調増加）
+                rows = [(i, r) for i, r in batch if i is None or i > self._replayed_upto]
+                if self._down and self._spool is not None:
+                    self._bump("deferred", len(rows))
+                else:
+                    self._ship(rows, live=True)
+            finally:
+                self._done(len(batch))
+
+    def _replay(self) -> None:
+        """
+        スプールに残った行を古い順にまとめて送る．
+
+        送れなかった行は飛ばして先へ進む（試行回数が上限に達した行は隔離する）．
+        ログAPIが落ちているとみなしたら，そこで止めて次の機会に回す．
+        """
+        if self._spool is None or time.monotonic() < self._next_replay:
+            return
+        self._next_replay = time.monotonic() + self.settings.replay_interval
+
+        # 落ちているかどうかはこの replay の中の連続失敗で判断し直す
+        self._failures = 0
+        after = 0
+        while not self._stop.is_set():
+            rows = self._spool_call(lambda s: s.pending(self.settings.replay_batch, after))
+            if not rows:
+                break
+            self._bump("replayed", self._ship(rows))
+            after = self._replayed_upto = max(self._replayed_upto, rows[-1][0])
+            if self._down:
+                return
+        self._down = False
+
+    def _ship(self, rows: list, live: bool = False) -> int:
+        """
+        (スプールの id, レコード) の並びを送り，送れたレコード数を返す．
+
+        送れた行はスプールから消し，送れなかった行は試行回数を増やして残す．
+        ログAPIが落ちているとみなしたら（スプールがあるとき）残りは送らない．
+        live（キューから来た行）なら，送らなかった行を deferred として数える
+        （replay の行はスプールに残っているだけなので，何度 replay しても数えない）．
+        """
+        if self.settings.batch_requests:
+            groups = [rows] if rows else []
+        else:
+            groups = [[row] for row in rows]
+
+        sent = 0
+        for n, group in enumerate(groups):
+            ids = [i for i, _ in group if i is not None]
+            body = [r for _, r in group] if self.settings.batch_requests else group[0][1]
+            outcome, error, unreachable = self._send_with_retry(body, len(group))
+            if outcome == "sent":
+                self._spool_call(lambda s: s.delete(ids))
+                sent += len(group)
+                self._failures = 0
+                self._down = False
+            elif outcome == "rejected":
+                # 4xx はそのレコードだけの問題なので，ログAPIの状態は変えない
+                self._spool_call(lambda s: s.mark_failed(ids, error, rejected=True))
+            elif self._spool is not None:
+                self._spool_call(lambda s: s.mark_failed(ids, error))
+                self._quarantine()
+                self._failures += 1
+                if unreachable or self._failures >= DOWN_AFTER_FAILURES:
+                    if live:
+                        self._bump("deferred", sum(len(g) for g in groups[n + 1:]))
+                    self._down = True
+                    self._next_replay = time.monotonic() + self.settings.replay_interval
+                    break
+        return sent
+
+    def _quarantine(self) -> None:
+        """試行回数が上限に達したスプールの行を隔離し，その件数とエラーを記録する．"""
+        limit = self.settings.spool_max_attempts
+        n = self._spool_call(lambda s: s.quarantine(limit))
+        if n:
+            self._bump("quarantined", n)
+            self._record_error(RuntimeError(f"{limit} 回送れなかった {n} 行を隔離した"))
+
+    def _send_with_retry(self, body, n_records: int) -> tuple:
+        """
+        送信して ("sent" | "rejected" | "failed", エラー文, 接続できなかったか) を返す．
+        """
+        s = self.settings
+        for attempt in range(1, s.max_attempts + 1):
+            try:
+                self._post(body)
+            except _RetryableError as e:
+                error = e
+            except Exception as e:  # 再送しても通らない（4xx など）
+                self._bump("rejected", n_records)
+                self._record_error(e)
+                return "rejected", str(e), False
+            else:
+                self._bump("sent", n_records)
+                return "sent", "", False
+
+            self._record_error(error)
+            if attempt == s.max_attempts:
+                break
+            self._bump("retries")
+            delay = min(s.max_backoff, s.backoff * 2 ** (attempt - 1))
+            # 終了処理中（_stop がセット済み）は待たずに再送する
+            self._stop.wait(delay * random.uniform(0.5, 1.0))
+        self._bump("failed", n_records)
+        return "failed", str(error), error.unreachable
+
+    def _post(self, body) -> None:
+        import requests
+
+        self._bump("requests")
+        try:
+            r = http_client.post(
+                self.settings.url,
+                json=body,
+                headers={"Authorization": f"Bearer {self.settings.token}"},
+                timeout=self.settings.timeout,
+            )
+        except requests.RequestException as e:
+            raise _RetryableError(f"{type(e).__name__}: {e}", unreachable=True) from e
+
+        if r.status_code == 429 or r.status_code >= 500:
+            raise _RetryableError(f"ログAPIエラー: {r.status_code}")
+        if r.status_code >= 400:
+            raise RuntimeError(f"ログAPIエラー: {r.status_code} {r.text[:200]}")
+
+    def _record_error(self, error: Exception) -> None:
+        with self._lock:
+            self._stats["last_error"] = str(error)
+
+
+_LOCK = threading.Lock()
+_SHIPPERS = {}
+
+
+def _settings_from_secrets(url: str, token: str) -> ShipperSettings:
+    return ShipperSettings(
+        url=url,
+        token=token,
+        queue_max=int(st.secrets.get("log_queue_max", 1000)),
+        batch_size=int(st.secrets.get("log_batch_size", 20)),
+        batch_requests=bool(st.secrets.get("log_batch_requests", False)),
+        max_attempts=int(st.secrets.get("log_max_attempts", 5)),
+        spool_path=str(st.secrets.get("log_spool_path", DEFAULT_SPOOL_PATH)),
+        replay_interval=float(st.secrets.get("log_replay_interval", 60)),
+        spool_max_attempts=int(st.secrets.get("log_spool_max_attempts", 5)),
+    )
+
+
+def get_log_shipper(url: str, token: str) -> LogShipper:
+    """
+    プロセス共通の送信器を返す．
+
+    設定が変わったときは新しい送信器を作り，古い方は残りを送ってから止める．
+    """
+    settings = _settings_from_secrets(url, token)
+    shipper = _SHIPPERS.get(settings)
+    if shipper is not None:
+        return shipper
+
+    with _LOCK:
+        shipper = _SHIPPERS.get(settings)
+        if shipper is None:
+            old = list(_SHIPPERS.values())
+            _SHIPPERS.clear()
+            shipper = _SHIPPERS[settings] = LogShipper(settings)
+            for o in old:
+                threading.Thread(target=o.close, daemon=True).start()
+    return shipper
+
+
+def log_shipper_stats() -> dict:
+    """送信器ごとの件数（送信済み・再送・破棄など）を返す．"""
+    with _LOCK:
+        return {s.url: shipper.stats() for s, shipper in _SHIPPERS.items()}
+
+
+def _collect_log_metrics() -> list:
+    """送信待ち・スプールの残り・API 停止中かどうかを metrics に出す．"""
+    gauges = {
+        "queued": "キューで送信を待っているレコード数",
+        "spool_pending": "スプールに残っている（未送信の）レコード数",
+        "spool_rejected": "API に拒否されてスプールに残したレコード数",
+        "spool_quarantined": "試行回数の上限に達してスプールで隔離したレコード数",
+        "api_down": "API が止まっているとみなしているか（1 なら停止中）",
+    }
+    stats = log_shipper_stats()
+    return [
+        (f"log_{name}", "gauge", doc, [({"url": url}, int(s.get(name) or 0)) for url, s in stats.items()])
+        for name, doc in gauges.items()
+    ]
+
+
+_LOG_EVENTS = counter(
+    "log_shipper_events_total",
+    "送信器の件数（event は enqueued / sent / retries / failed / rejected / dropped / deferred / replayed など）",
+    ("event",),
+)
+register_collector("log_shipper", _collect_log_metrics)
+
+
+@atexit.register
+def _flush_on_exit() -> None:
+    with _LOCK:
+        shippers = list(_SHIPPERS.values())
+    for shipper in shippers:
+        shipper.close(timeout=5.0)
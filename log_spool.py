@@ -0,0 +1,112 @@
+# log_spool.py
+"""
+ログレコードの先書き用スプール（SQLite）．
+
+append_simple_log が作ったレコードは，送信より先にここへ書き込む．
+送信に成功した行は消し，ログAPIが落ちていて送れなかった行は残しておいて，
+log_shipper のワーカーが後でまとめて再送する（replay）．
+プロセスが再起動しても，スプールに残った行は次のプロセスが送る．
+
+- 標準ライブラリの sqlite3 だけを使う（WAL モード，synchronous=NORMAL）
+- 4xx で受け付けられなかった行は rejected=1 にして再送の対象から外す（中身は残す）
+- 何度送っても通らない行（その行だけ 5xx になるなど）は，試行回数が上限に達したら
+  rejected=2（隔離）にして再送の対象から外す（中身は残す）
+
+手元で中身を確認する：
+    python log_spool.py [スプールのパス]
+"""
+import json
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent
+DEFAULT_SPOOL_PATH = ROOT_DIR / ".cache" / "log_spool.sqlite3"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    id         INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at REAL    NOT NULL,
+    body       TEXT    NOT NULL,
+    attempts   INTEGER NOT NULL DEFAULT 0,
+    rejected   INTEGER NOT NULL DEFAULT 0,  -- 0: 送信待ち，1: 4xx で拒否，2: 試行回数の上限で隔離
+    last_error TEXT    NOT NULL DEFAULT ''
+)
+"""
+
+
+class LogSpool:
+    """スレッド間で共有できる SQLite のスプール．1接続をロックで守って使う．"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(_SCHEMA)
+
+    def append(self, record: dict) -> int:
+        """レコードを1行書き込み，その行の id を返す（id は単調増加）．"""
+        body = json.dumps(record, ensure_ascii=False, default=str)
+        with self._lock:
+            cur = self._conn.execute(
+                "INSERT INTO records (created_at, body) VALUES (?, ?)", (time.time(), body)
+            )
+        return cur.lastrowid
+
+    def pending(self, limit: int, after_id: int = 0) -> list:
+        """未送信の行を id 順に (id, record) で返す．"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, body FROM records WHERE rejected = 0 AND id > ? ORDER BY id LIMIT ?",
+                (after_id, limit),
+            ).fetchall()
+        return [(i, json.loads(body)) for i, body in rows]
+
+    def delete(self, ids: list) -> None:
+        """送信済みの行を消す．"""
+        if not ids:
+            return
+        with self._lock:
+            self._conn.executemany("DELETE FROM records WHERE id = ?", [(i,) for i in ids])
+
+    def mark_failed(self, ids: list, error: str, rejected: bool = False) -> None:
+        """送れなかった行の試行回数とエラーを記録する．rejected なら再送の対象から外す．"""
+        if not ids:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE records SET attempts = attempts + 1, last_error = ?, rejected = ? WHERE id = ?",
+                [(error[:500], int(rejected), i) for i in ids],
+            )
+
+    def quarantine(self, max_attempts: int) -> int:
+        """試行回数が max_attempts 以上の送信待ちの行を隔離し，隔離した行数を返す．"""
+        with self._lock:
+            cur = self._conn.execute(
+                "UPDATE records SET rejected = 2 WHERE rejected = 0 AND attempts >= ?", (max_attempts,)
+            )
+        return cur.rowcount
+
+    def counts(self) -> dict:
+        with self._lock:
+            pending, rejected, quarantined = self._conn.execute(
+                "SELECT COALESCE(SUM(rejected = 0), 0), COALESCE(SUM(rejected = 1), 0),"
+                " COALESCE(SUM(rejected = 2), 0) FROM records"
+            ).fetchone()
+        return {"pending": pending, "rejected": rejected, "quarantined": quarantined}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+if __name__ == "__main__":
+    spool = LogSpool(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_SPOOL_PATH)
+    print(f"{spool.path}: {spool.counts()}")
+    for i, record in spool.pending(5):
+        print(f"  #{i} {record.get('ts')} session_id={record.get('session_id')}")
@@ -1,14 +1,58 @@
 # log_utils.py
-import hashlib
-import json
+import threading
+import time
 import uuid
+from collections import OrderedDict
 from datetime import datetime, timezone
 from typing import Any
 from urllib.parse import quote # 本間追加
 
-import requests
 import streamlit as st
 
+from log_shipper import get_log_shipper
+from metrics import counter
+from perf_trace import traced
+
+# 重複送信の抑止に使う入力の項目（2_input.py の user_preferences のキー）
+DEDUP_INPUT_KEYS = ("brix", "acid", "bitterness", "aroma", "moisture", "texture")
+DEDUP_TTL_SECONDS = 600
+DEDUP_MAX_ENTRIES = 4096
+
+_DEDUP_LOCK = threading.Lock()
+_RECENT_LOGS = OrderedDict()
+
+_LOG_SUBMISSIONS = counter(
+    "log_submissions_total",
+    "append_simple_log の結果（submitted / duplicate / not_configured / refused）",
+    ("result",),
+)
+
+
+def _claim_log_key(key: tuple) -> bool:
+    """
+    直近 DEDUP_TTL_SECONDS 秒に同じキーを送っていなければ記録して True を返す．
+
+    プロセス全体で共有する（別タブ・rerun からの同じ送信もまとめて抑止する）．
+    古いものから消して DEDUP_MAX_ENTRIES 件に抑える．
+    """
+    now = time.monotonic()
+    with _DEDUP_LOCK:
+        while _RECENT_LOGS:
+            oldest, seen_at = next(iter(_RECENT_LOGS.items()))
+            if now - seen_at < DEDUP_TTL_SECONDS and len(_RECENT_LOGS) < DEDUP_MAX_ENTRIES:
+                break
+            del _RECENT_LOGS[oldest]
+
+        if key in _RECENT_LOGS:
+            return False
+        _RECENT_LOGS[key] = now
+        return True
+
+
+def _release_log_key(key: tuple) -> None:
+    with _DEDUP_LOCK:
+        _RECENT_LOGS.pop(key, None)
+
 
 def normalize_result_for_log(result_value: Any) -> list:
     """
@@ -44,19 +88,36 @@ def normalize_result_for_log(result_value: Any) -> list:
     return normalized[:3]
 
 
+@traced()
 def append_simple_log(input_dict: dict, result_value=None) -> None:
     """
     1回の診断につき1行だけD1ログAPIへ送信する．
     input_json の中に user_id も含めて保存する．
     Secrets未設定ならスキップする．
-    直近の重複送信は抑止する．
+    同じ session_id・入力・結果の送信は，直近 DEDUP_TTL_SECONDS 秒のあいだ1回に抑える．
+    session_id（sid）は app.py が診断ごとに採番するので，抑えるのは同じ診断の rerun や
+    再送だけで，同じ入力でもやり直した診断は別の行として送る（クリックログはその sid を使う）．
+    送信は log_shipper のワーカーが行うので，この関数は送信を待たずに戻る．
     """
     url = st.secrets.get("log_api_url")
     token = st.secrets.get("log_api_token")
     if not url or not token:
+        _LOG_SUBMISSIONS.inc(result="not_configured")
         return
 
     normalized_result = normalize_result_for_log(result_value)
+    session_id = st.session_state.setdefault("sid", str(uuid.uuid4()))
+    inputs = input_dict or {}
+
+    # 入力6項目・結果の id・session_id だけで作るキー（ペイロード全体は直列化しない）
+    dedup_key = (
+        session_id,
+        tuple(inputs.get(k) for k in DEDUP_INPUT_KEYS),
+        tuple(r.get("id", r.get("name")) for r in normalized_result),
+    )
+    if not _claim_log_key(dedup_key):
+        _LOG_SUBMISSIONS.inc(result="duplicate")
+        return
 
     input_with_user = dict(input_dict or {})
     input_with_user["user_id"] = st.session_state.get("user_id")
@@ -64,40 +125,19 @@ def append_simple_log(input_dict: dict, result_value=None) -> None:
     payload = {
         "user_id": st.session_state.get("user_id"),
         "ts": datetime.now(timezone.utc).isoformat(),
-        "session_id": st.session_state.setdefault("sid", str(uuid.uuid4())),
+        "session_id": session_id,
         "input_json": input_with_user,
         "result": normalized_result,
     }
 
-    dedup_src = json.dumps(
-        {
-            "input_json": payload["input_json"],
-            "result": payload["result"],
-        },
-        ensure_ascii=False,
-        sort_keys=True,
-        default=str,
-    )
-    dedup_key = hashlib.sha256(dedup_src.encode("utf-8")).hexdigest()
-
-    if st.session_state.get("last_log_key") == dedup_key:
-        return
+    # 送信はバックグラウンドの送信器に任せ，ここでは待たない
+    if not get_log_shipper(url, token).submit(payload):
+        _LOG_SUBMISSIONS.inc(result="refused")
+        _release_log_key(dedup_key)
+        st.info("ログ送信をスキップした（理由：ログをスプールにもキューにも入れられなかった）")
+    else:
+        _LOG_SUBMISSIONS.inc(result="submitted")
 
-    try:
-        r = requests.post(
-            url,
-            json=payload,
-            headers={"Authorization": f"Bearer {token}"},
-            timeout=5,
-        )
-        if r.status_code >= 400:
-            st.error(f"ログAPIエラー: {r.status_code}\n{r.text}")
-            return
-
-        st.session_state["last_log_key"] = dedup_key
-
-    except Exception as e:
-        st.info(f"ログ送信をスキップした（理由：{e}）")
 
 def build_click_log_url(slot: str, destination_url: str) -> str:
     """
@@ -0,0 +1,358 @@
+# metrics.py
+"""
+プロセス共通のメトリクス（カウンタ・ゲージ・ヒストグラム）と，その書き出し．
+
+本番の通信量のもとで，
+
+- 各キャッシュ（R2 のデータセット・推薦結果のメモ・レーダーチャート・縮小画像）のヒット／ミス
+- R2 への問い合わせ回数・転送バイト数・所要時間・接続の再利用
+- 推薦計算の所要時間，レーダーチャートの warm-up の状況
+- 結果カードに載せる画像の大きさ
+- ログ送信の結果（送信・再試行・失敗・破棄など）と送信待ちの件数
+
+を外から見られるようにする．各モジュールは import 時に counter() / gauge() / histogram() で
+メトリクスを作り，処理の中で inc() / set() / observe() を呼ぶ．既存の *_stats() のように
+書き出すときに読めばよい値は register_collector() で登録する．
+
+書き出しは Prometheus のテキスト形式（render_prometheus）か JSON（metrics_snapshot）で，
+secrets.toml の設定に応じてファイルへ定期的に書くか，別ポートで配信する．
+
+secrets.toml で調整できる項目（いずれも省略可．既定ではどちらも行わない）：
+    metrics_path     : 書き出し先のファイル（拡張子が .json なら JSON，それ以外は Prometheus 形式）
+    metrics_interval : ファイルへ書き出す間隔（秒．既定 15）
+    metrics_port     : 0 より大きければ，このポートで /metrics と /metrics.json を配信する
+    metrics_host     : 配信するアドレス（既定 "127.0.0.1"）
+"""
+import bisect
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import streamlit as st
+
+ROOT_DIR = Path(__file__).resolve().parent
+PREFIX = "citrus_"
+
+# 秒単位のヒストグラムの既定の区切り（1ms〜10s）
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# バイト数のヒストグラムの区切り（100B〜10MB）
+SIZE_BUCKETS = (100, 1_000, 10_000, 30_000, 100_000, 300_000, 1_000_000, 3_000_000, 10_000_000)
+
+_LOCK = threading.Lock()
+_METRICS = {}
+_COLLECTORS = {}
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, doc: str, labelnames: tuple = ()):
+        self.name = PREFIX + name
+        self.doc = doc
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels: dict) -> tuple:
+        if not self.labelnames:
+            return ()
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def samples(self) -> list:
+        """[(ラベルの dict, 値)] を返す．"""
+        with self._lock:
+            items = list(self._values.items())
+        return [(dict(zip(self.labelnames, k)), v) for k, v in sorted(items)]
+
+
+class Counter(_Metric):
+    """増えるだけの値（回数・バイト数など）．"""
+
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """その時点の値（キューの長さなど）．"""
+
+    kind = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Histogram(_Metric):
+    """値の分布（所要時間・大きさ）．区切りごとの件数と合計・件数を持つ．"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, doc: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, doc, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            h = self._values.get(key)
+            if h is None:
+                h = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            h[0][i] += 1
+            h[1] += value
+            h[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """with の中身の所要時間（秒）を記録する．"""
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0, **labels)
+
+    def samples(self) -> list:
+        """[(ラベルの dict, {"buckets": {上限: 累積件数}, "sum": 合計, "count": 件数})] を返す．"""
+        with self._lock:
+            items = [(k, (list(h[0]), h[1], h[2])) for k, h in self._values.items()]
+        out = []
+        for k, (counts, total, count) in sorted(items):
+            cumulative, acc = {}, 0
+            for le, n in zip(self.buckets + (math.inf,), counts):
+                acc += n
+                cumulative[le] = acc
+            out.append((dict(zip(self.labelnames, k)), {"buckets": cumulative, "sum": total, "count": count}))
+        return out
+
+
+def _get_or_create(cls, name: str, doc: str, labelnames: tuple, **kwargs):
+    with _LOCK:
+        metric = _METRICS.get(name)
+        if metric is None:
+            metric = _METRICS[name] = cls(name, doc, labelnames, **kwargs)
+        elif not isinstance(metric, cls) or metric.labelnames != tuple(labelnames):
+            raise ValueError(f"メトリクス {name} は別の種類・ラベルで登録済み")
+    return metric
+
+
+def counter(name: str, doc: str, labelnames: tuple = ()) -> Counter:
+    """name のカウンタを返す（無ければ作る．モジュールの読み直しでも同じものを返す）．"""
+    return _get_or_create(Counter, name, doc, labelnames)
+
+
+def gauge(name: str, doc: str, labelnames: tuple = ()) -> Gauge:
+    return _get_or_create(Gauge, name, doc, labelnames)
+
+
+def histogram(name: str, doc: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS) -> Histogram:
+    return _get_or_create(Histogram, name, doc, labelnames, buckets=buckets)
+
+
+def register_collector(name: str, collect) -> None:
+    """
+    書き出しのたびに呼ぶ関数を登録する（同じ name なら置き換える）．
+
+    collect() は (メトリクス名, 種類 "counter"|"gauge", 説明, [(ラベルの dict, 値)]) の
+    リストを返す．既存の *_stats() の値をそのまま出すのに使う．
+    """
+    with _LOCK:
+        _COLLECTORS[name] = collect
+
+
+def _families() -> list:
+    """(名前, 種類, 説明, サンプル) を名前順に返す．失敗した collector は飛ばす．"""
+    with _LOCK:
+        metrics = list(_METRICS.values())
+        collectors = list(_COLLECTORS.values())
+    families = [(m.name, m.kind, m.doc, m.samples()) for m in metrics]
+    for collect in collectors:
+        try:
+            families.extend((PREFIX + n, kind, doc, samples) for n, kind, doc, samples in collect())
+        except Exception:
+            continue
+    return sorted(families, key=lambda f: f[0])
+
+
+# 複数のモジュールで使うもの．cache ごとのヒット率・画像の種類ごとの大きさを並べて見られるようにまとめる
+CACHE_LOOKUPS = counter(
+    "cache_lookups_total", "キャッシュの引き当て（result は hit / miss など）", ("cache", "result")
+)
+IMAGE_PAYLOAD_BYTES = histogram(
+    "image_payload_bytes", "結果カードの <img> に載せる参照（URL か data URL）の大きさ",
+    ("kind", "delivery"), buckets=SIZE_BUCKETS,
+)
+
+
+# ===== 書き出し =====
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_prometheus() -> str:
+    """全メトリクスを Prometheus のテキスト形式（0.0.4）で返す．"""
+    lines = []
+    for name, kind, doc, samples in _families():
+        lines.append(f"# HELP {name} {_escape(doc)}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            if kind != "histogram":
+                lines.append(f"{name}{_labels(labels)} {_number(value)}")
+                continue
+            for le, n in value["buckets"].items():
+                lines.append(f"{name}_bucket{_labels({**labels, 'le': _number(le)})} {n}")
+            lines.append(f"{name}_sum{_labels(labels)} {_number(value['sum'])}")
+            lines.append(f"{name}_count{_labels(labels)} {value['count']}")
+    return "\n".join(lines) + "\n"
+
+
+def metrics_snapshot() -> dict:
+    """全メトリクスを JSON にできる dict で返す（ヒストグラムの +Inf は "+Inf" にする）．"""
+    out = {"timestamp": time.time(), "metrics": {}}
+    for name, kind, doc, samples in _families():
+        rows = []
+        for labels, value in samples:
+            if kind == "histogram":
+                value = dict(value, buckets={_number(le): n for le, n in value["buckets"].items()})
+            rows.append({"labels": labels, "value": value})
+        out["metrics"][name] = {"type": kind, "help": doc, "samples": rows}
+    return out
+
+
+def write_metrics_file(path) -> None:
+    """path に書き出す（.json なら JSON，それ以外は Prometheus 形式）．途中の状態は見せない．"""
+    path = Path(path)
+    if path.suffix.lower() == ".json":
+        text = json.dumps(metrics_snapshot(), ensure_ascii=False)
+    else:
+        text = render_prometheus()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(f".{os.getpid()}.tmp")
+    tmp.write_text(text, encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def _setting(name: str, default):
+    try:
+        return st.secrets.get(name, default)
+    except FileNotFoundError:  # secrets.toml が無い（ベンチなど）ときは既定値
+        return default
+
+
+def _file_writer(path: Path, interval: float) -> None:
+    while True:
+        try:
+            write_metrics_file(path)
+        except OSError:
+            pass
+        time.sleep(interval)
+
+
+def _serve(host: str, port: int):
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] == "/metrics":
+                body, ctype = render_prometheus().encode("utf-8"), "text/plain; version=0.0.4; charset=utf-8"
+            elif self.path.split("?")[0] == "/metrics.json":
+                body, ctype = json.dumps(metrics_snapshot()).encode("utf-8"), "application/json"
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", ctype)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
+
+
+_EXPORT_LOCK = threading.Lock()
+_EXPORT = {}
+
+
+def start_metrics_export() -> None:
+    """
+    secrets.toml の設定に応じて，ファイルへの定期書き出しと配信用のポートを用意する．
+
+    app.py の実行ごとに呼んでよい（プロセスにつき1回だけ始める）．
+    ポートが使えないとき（別プロセスが使用中など）は配信だけをあきらめる．
+    """
+    if _EXPORT:
+        return
+    with _EXPORT_LOCK:
+        if _EXPORT:
+            return
+        path = str(_setting("metrics_path", "") or "")
+        if path:
+            interval = float(_setting("metrics_interval", 15))
+            path = Path(path) if Path(path).is_absolute() else ROOT_DIR / path
+            threading.Thread(
+                target=_file_writer, args=(path, interval), name="metrics-writer", daemon=True
+            ).start()
+            _EXPORT["path"] = str(path)
+        port = int(_setting("metrics_port", 0))
+        if port > 0:
+            host = str(_setting("metrics_host", "127.0.0.1"))
+            try:
+                _EXPORT["server"] = _serve(host, port)
+            except OSError as e:
+                _EXPORT["server_error"] = f"{type(e).__name__}: {e}"
+        _EXPORT["started"] = True
+
+
+def metrics_export_status() -> dict:
+    """書き出し先と配信の状態を返す．"""
+    status = {k: v for k, v in _EXPORT.items() if k != "server"}
+    server = _EXPORT.get("server")
+    if server is not None:
+        status["server"] = "%s:%d" % server.server_address[:2]
+    return status
+
+
+def _collect_export_metrics() -> list:
+    """書き出し先のファイルと配信用のポートが使えているかを metrics に出す．"""
+    status = metrics_export_status()
+    return [
+        ("metrics_file_export", "gauge", "metrics をファイルへ書き出しているか（1 なら書き出し中）",
+         [({}, int("path" in status))]),
+        ("metrics_server_up", "gauge", "metrics を配信するポートを開けているか（1 なら配信中）",
+         [({}, int("server" in status))]),
+    ]
+
+
+register_collector("metrics_export", _collect_export_metrics)
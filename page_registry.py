@@ -0,0 +1,64 @@
+# page_registry.py
+"""
+pages/ 配下のページを1プロセスにつき1回だけ読み込むレジストリ．
+
+各ページはモジュールとして一度だけ import し（バイトコードは __pycache__ に残る），
+以降の rerun では render() だけを呼ぶ．ファイルの読み込みやコンパイル，
+関数定義（@st.cache_data など）の作り直しは rerun のたびには発生しない．
+"""
+import importlib.util
+import sys
+import threading
+from pathlib import Path
+from types import ModuleType
+
+from perf_trace import span
+
+ROOT_DIR = Path(__file__).resolve().parent
+
+_LOCK = threading.Lock()
+
+
+def _module_name(rel_path: str) -> str:
+    """"pages/2_input.py" → "pages_2_input" のように import 可能な名前へ変換する．"""
+    return "_".join(Path(rel_path).with_suffix("").parts)
+
+
+def load_page(rel_path: str) -> ModuleType:
+    """
+    ページファイルをモジュールとして読み込んで返す．
+
+    読み込み済みのモジュールは sys.modules に登録しておき，2回目以降はそれを返す．
+    Streamlit の開発サーバはファイル変更時に sys.modules から該当モジュールを外すため，
+    編集したページは次の rerun で自動的に読み直される．
+    """
+    name = _module_name(rel_path)
+    mod = sys.modules.get(name)
+    if mod is not None:
+        return mod
+
+    with _LOCK:
+        mod = sys.modules.get(name)
+        if mod is not None:
+            return mod
+
+        path = ROOT_DIR / rel_path
+        spec = importlib.util.spec_from_file_location(name, path)
+        if spec is None or spec.loader is None:
+            raise ImportError(f"ページを読み込めない: {path}")
+
+        mod = importlib.util.module_from_spec(spec)
+        sys.modules[name] = mod
+        try:
+            spec.loader.exec_module(mod)
+        except BaseException:
+            sys.modules.pop(name, None)
+            raise
+
+    return mod
+
+
+def render_page(rel_path: str) -> None:
+    """ページモジュールの render() を呼び出す（perf_trace のスパン "page:<パス>" として記録する）．"""
+    with span(f"page:{rel_path}"):
+        load_page(rel_path).render()
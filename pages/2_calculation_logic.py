@@ -2,178 +2,547 @@
 # app.pyをメインの関数として，ページ遷移を行っています．現在は1_top.pyから，2_input.pyへの遷移が可能になっています．ここから2_input.pyから，3_output_nologin.pyへの遷移をapp.pyのなかで行いたいです．そのために，2_input.pyで行える入力(甘さ，酸味，苦味，香り，ジューシーさ，食感のユーザーの好みの1~6の整数値と，希望の季節を表す(winter, spring, summer, autumnのいずれか)の文字列)を2_calculation_logic.pyの入力として与えます．2_calculation_logic.pyで得られるIDの出力を3_output_nologin.pyの入力として与え，csvファイルを読み込む
 # app.pyをメインの関数として，ページ遷移を行っています．現在は1_top.pyから，2_input.pyへの遷移が可能になっています．ここから2_input.pyから，3_output_nologin.pyへの遷移をapp.pyのなかで行いたいです．そのために，2_input.pyで行える入力(甘さ，酸味，苦味，香り，ジューシーさ，食感のユーザーの好みの1~6の整数値を2_calculation_logic.pyの入力として与えます．2_calculation_logic.pyで得られるIDの出力を3_output_nologin.pyの入力として与え，R2 データベースを読み込むことで，柑橘の種類を見えるようにしてください．
 
+import hashlib
 import math
-from typing import List, Dict
-from io import BytesIO
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Dict, NamedTuple
+from pathlib import Path
+
+import sys
 
 import numpy as np
 import pandas as pd
 import streamlit as st
-import boto3
-
-# 柑橘の特徴量として使うカラム名
-FEATURES = ["brix", "acid", "bitterness", "aroma", "moisture", "texture"]
-
-# 入力CSVの別名 → 標準名マッピング
-ALIASES = {
-    "brix": ["brix", "sweet", "sweetness", "sugar"],
-    "acid": ["acid", "acidity", "sour", "sourness"],
-    "bitterness": ["bitterness", "bitter"],
-    "aroma": ["aroma", "smell", "fragrance", "flavor", "flavour"],
-    "moisture": ["moisture", "juicy", "juiciness"],
-    "texture": ["texture", "elastic", "firmness", "pulpiness"],
-}
-
 
-def _standardize_columns(df: pd.DataFrame) -> pd.DataFrame:
-    """CSVのカラム名を標準化し，idカラムを補完する．"""
-    # 小文字化＆前後の空白除去
-    df = df.rename(columns={c: c.strip().lower() for c in df.columns})
-
-    # season を推定
-    if "season" not in df.columns:
-        for cand in ["seasons", "season_pref", "in_season"]:
-            if cand in df.columns:
-                df = df.rename(columns={cand: "season"})
-                break
-
-    # 特徴量の別名を標準名へ
-    for std, cands in ALIASES.items():
-        if std in df.columns:
-            continue
-        for cand in cands:
-            if cand in df.columns:
-                df = df.rename(columns={cand: std})
-                break
-
-    # name / id を補完
-    if "name" not in df.columns:
-        for cand in ["品種名", "citrus_name", "item_name", "title"]:
-            if cand in df.columns:
-                df = df.rename(columns={cand: "name"})
-                break
-        if "name" not in df.columns:
-            df["name"] = [f"item_{i}" for i in range(len(df))]
-
-    if "id" not in df.columns:
-        df["id"] = np.arange(1, len(df) + 1)
-
-    return df
-
-
-def parse_seasons(cell: str) -> List[str]:
-    """seasonセルをカンマ区切りで分割し，小文字リストにする．"""
-    if not cell:
-        return []
-    return [s.strip().lower() for s in str(cell).split(",") if s.strip()]
+ROOT_DIR = Path(__file__).resolve().parent.parent
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
 
+from catalogue import FEATURES, load_features, parse_seasons
+from metrics import CACHE_LOOKUPS, histogram, register_collector
+from perf_trace import traced
 
-# ===== R2 からの読み込み部分（app_old.py と同じ思想） =====
+# ===== R2 からの読み込み部分（catalogue と共有） =====
 
-@st.cache_data(ttl=3600)
-def _load_citrus_raw_from_r2(key: str | None = None) -> pd.DataFrame:
+def _dataset_version(key: str | None = None) -> str:
     """
-    Cloudflare R2 から生のCSVを読み込む．
-    secrets.toml の設定は app_old.py と同じものを前提とする．
+    特徴量CSVの版（ETag）を返す．
+
+    版の確認は r2_datasets が条件付き GET で行う．この値が変わったときだけ
+    インデックスを作り直す．
     """
-    required = ("r2_account_id", "r2_access_key_id", "r2_secret_access_key", "r2_bucket")
-    missing = [k for k in required if k not in st.secrets]
-    if missing:
-        raise RuntimeError(
-            f"R2の接続情報が見つからない．.streamlit/secrets.toml に {missing} を設定すること．"
-        )
+    return load_features(key).version
 
-    s3 = boto3.client(
-        "s3",
-        endpoint_url=f"https://{st.secrets['r2_account_id']}.r2.cloudflarestorage.com",
-        aws_access_key_id=st.secrets["r2_access_key_id"],
-        aws_secret_access_key=st.secrets["r2_secret_access_key"],
-    )
 
-    obj_key = key or st.secrets.get("r2_key")
-    if not obj_key:
-        raise RuntimeError(
-            "R2のオブジェクトキーが未指定である．r2_key を secrets.toml に設定すること．"
-        )
+@traced()
+def _prepare_dataframe(r2_key: str | None = None) -> pd.DataFrame:
+    """
+    特徴量と season 等を整えた DataFrame を返す．
+
+    パースと標準化は catalogue が1回だけ行い，結果ページと同じものを使う．
+    戻り値は全セッションで共有されるので書き換えないこと．
+    """
+    return load_features(r2_key).data
 
-    obj = s3.get_object(Bucket=st.secrets["r2_bucket"], Key=obj_key)
-    return pd.read_csv(BytesIO(obj["Body"].read()), encoding="utf-8-sig")
 
+# ===== 推薦用インデックス =====
 
-@st.cache_data
-def _prepare_dataframe(r2_key: str | None = None) -> pd.DataFrame:
+class CitrusIndex(NamedTuple):
     """
-    R2 からCSVを読み込み，特徴量と season 等を整えた DataFrame を返す．
+    推薦計算に必要な配列だけを持つ読み取り専用のインデックス．
+
+    - X          : (N, 6) の float32 特徴行列（C連続）
+    - ids        : 品種ID
+    - names      : 品種名
+    - version    : 元にした R2 オブジェクトの版（ETag）
+
+    行は名前昇順（同名は元の行順）に並べて保持する．そのため行位置の昇順が
+    そのまま同点時の並びになり，バッチ計算で順位を引き直す必要がない．
     """
-    df = _load_citrus_raw_from_r2(r2_key)
-    df = _standardize_columns(df)
 
-    # 必須カラム確認
-    missing = [c for c in FEATURES if c not in df.columns]
-    if missing:
-        raise KeyError(f"必要カラムが見つからない: {missing} / 取得カラム: {list(df.columns)}")
+    X: np.ndarray
+    ids: np.ndarray
+    names: np.ndarray
+    version: str = ""
+
+    @classmethod
+    def from_dataframe(cls, df: pd.DataFrame, version: str = "") -> "CitrusIndex":
+        """_prepare_dataframe() の戻り値からインデックスを作る．"""
+        order = np.argsort(df["name"].astype(str).to_numpy(), kind="stable")
+        df = df.iloc[order]
+        arrays = (
+            np.ascontiguousarray(df[FEATURES].to_numpy(dtype=np.float32)),
+            df["id"].to_numpy(),
+            df["name"].astype(str).to_numpy(),
+        )
+        for arr in arrays:
+            arr.setflags(write=False)
+        return cls(*arrays, version=version)
+
+    def __len__(self) -> int:
+        return self.X.shape[0]
 
-    # 数値化して1〜6にクリップ
-    for col in FEATURES:
-        df[col] = pd.to_numeric(df[col], errors="coerce").clip(1, 6)
 
-    # season を文字列で用意
-    if "season" not in df.columns:
-        df["season"] = ""
-    df["season"] = df["season"].fillna("").astype(str)
+@st.cache_resource(max_entries=4, show_spinner=False)
+def _build_citrus_index(r2_key: str | None, version: str) -> CitrusIndex:
+    """版ごとに1回だけインデックスを作り，全セッションで共有する．"""
+    return CitrusIndex.from_dataframe(_prepare_dataframe(r2_key), version=version)
 
-    # 特徴量に欠損がある行は落とす
-    df = df.dropna(subset=FEATURES)
 
-    return df
+def get_citrus_index(r2_key: str | None = None) -> CitrusIndex:
+    """R2 オブジェクトの現在の版に対応するインデックスを返す．"""
+    return _build_citrus_index(r2_key, _dataset_version(r2_key))
 
 
 # ===== 類似度計算 =====
 
-def score_items(
-    df: pd.DataFrame,
+def _feature_weights(weights: Dict[str, float] | None, dtype=float) -> np.ndarray:
+    """特徴ごとの重みベクトルを FEATURES の並びで返す．"""
+    if weights is None:
+        weights = {k: 1.0 for k in FEATURES}
+    return np.array([weights[k] for k in FEATURES], dtype=dtype)
+
+
+def _weighted_scores(
+    X: np.ndarray,
     user_vec: np.ndarray,
-    season_pref: str = "",
-    weights: Dict[str, float] | None = None,
+    w: np.ndarray,
+    season_match: np.ndarray | None = None,
     season_boost: float = 0.03,
-) -> pd.DataFrame:
+) -> tuple[np.ndarray, np.ndarray]:
     """
-    類似度（スコア）を計算して降順ソートしたDataFrameを返す．
+    特徴行列 X とユーザベクトルから（距離，スコア）を計算する．
 
-    - user_vec: [brix, acid, bitterness, aroma, moisture, texture] の6次元ベクトル
-    - season_pref: "winter" などの希望季節（小文字・大文字は無視される）
+    user_vec が (6,) なら (N,) を，(B, 6) なら B 人分をまとめて (B, N) を返す．
     """
-    if weights is None:
-        weights = {k: 1.0 for k in FEATURES}
-
-    # 特徴ごとの重みベクトル
-    w = np.array([weights[k] for k in FEATURES], dtype=float)
-
     # 各特徴が1〜6スケールで最大差5を取ると仮定したときの最大距離
     max_dist = math.sqrt(np.sum((w * 5) ** 2))
 
-    # 特徴行列
-    X = df[FEATURES].to_numpy(dtype=float)
-
     # ユーザベクトルとの差
-    diffs = X - user_vec[None, :]
+    diffs = X - user_vec[..., None, :]
 
     # 重み付きユークリッド距離
-    dists = np.sqrt(np.sum((diffs * w[None, :]) ** 2, axis=1))
+    dists = np.sqrt(np.sum((diffs * w) ** 2, axis=-1))
 
     # 距離から類似度スコアへ変換（0〜1）
     scores = 1.0 - (dists / max_dist)
 
     # 季節希望が一致する行には season_boost を加点
+    if season_match is not None:
+        scores = scores + np.where(season_match, season_boost, 0.0)
+
+    return dists, np.clip(scores, 0.0, 1.0)
+
+
+# バッチ計算で1チャンクあたりに展開する要素数（float32 で約16MB）の上限
+BATCH_MAX_ELEMENTS = 4_000_000
+
+
+def _top_k_rows(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    (B, N) のスコア行列の各行について，上位k件の列番号を (B, k) で返す．
+
+    並びはスコア降順・列番号昇順（CitrusIndex は名前順に並んでいるので名前昇順と同じ）．
+    各行の k 番目のスコアを np.partition で求め，それより大きい列と，
+    k 番目と同点の列を左から必要数だけ選ぶので，全件ソートは行わない．
+    """
+    b, n = scores.shape
+    if k >= n:
+        return np.argsort(-scores, axis=1, kind="stable")
+
+    kth = -np.partition(-scores, k - 1, axis=1)[:, k - 1]
+    above = scores > kth[:, None]
+    tied = scores == kth[:, None]
+    need = k - above.sum(axis=1)
+    take = above | (tied & (np.cumsum(tied, axis=1) <= need[:, None]))
+
+    cols = np.nonzero(take)[1].reshape(b, k)
+    picked = np.take_along_axis(scores, cols, axis=1)
+    order = np.lexsort((cols, -picked), axis=-1)
+    return np.take_along_axis(cols, order, axis=1)
+
+
+# ===== 近傍探索バックエンド =====
+
+def _select_top_k(cand: np.ndarray, scores: np.ndarray, k: int) -> np.ndarray:
+    """候補の行番号とスコアから，スコア降順・行番号昇順で上位k件の行番号を返す．"""
+    order = np.lexsort((cand, -scores))
+    return cand[order[:k]]
+
+
+class BruteForceBackend:
+    """全品種との距離を NumPy で一括計算する（既定）．"""
+
+    name = "brute"
+
+    def __init__(self, index: CitrusIndex):
+        self.index = index
+
+    def query(self, P: np.ndarray, k: int, w: np.ndarray) -> np.ndarray:
+        _, scores = _weighted_scores(self.index.X, P, w)
+        return _top_k_rows(scores, k)
+
+
+class TreeBackend:
+    """
+    scikit-learn の KDTree / BallTree で候補を絞り込む．
+
+    重みを掛けた座標で木を作り（重みごとに1回），k 番目までの距離を半径とする
+    範囲検索で境界の同点も含めて候補を集める．最後の並べ替えは全件計算と同じ
+    スコアで行うので，結果は BruteForceBackend と一致する．
+    """
+
+    def __init__(self, index: CitrusIndex, kind: str = "kdtree", leaf_size: int = 40):
+        self.index = index
+        self.name = kind
+        self.leaf_size = leaf_size
+        self._trees = {}
+        self._lock = threading.Lock()
+
+    def _tree(self, w: np.ndarray):
+        key = w.tobytes()
+        tree = self._trees.get(key)
+        if tree is None:
+            from sklearn.neighbors import BallTree, KDTree
+
+            cls = KDTree if self.name == "kdtree" else BallTree
+            with self._lock:
+                tree = self._trees.get(key)
+                if tree is None:
+                    tree = cls(self.index.X * w, leaf_size=self.leaf_size)
+                    self._trees[key] = tree
+        return tree
+
+    def query(self, P: np.ndarray, k: int, w: np.ndarray) -> np.ndarray:
+        tree = self._tree(w)
+        Q = P * w
+        dist, _ = tree.query(Q, k=k)
+        # float32 のスコアで同点になる行を取りこぼさないよう，半径にはわずかな余裕を持たせる
+        cands = tree.query_radius(Q, r=dist[:, -1] * (1 + 1e-6) + 1e-6)
+
+        out = np.empty((P.shape[0], k), dtype=np.intp)
+        for i, cand in enumerate(cands):
+            _, scores = _weighted_scores(self.index.X[cand], P[i], w)
+            out[i] = _select_top_k(cand, scores, k)
+        return out
+
+
+class GridBucketBackend:
+    """
+    特徴ベクトルが同じ品種を1つの格子点（バケツ）にまとめ，格子点単位で距離を計算する．
+
+    特徴量は1〜6の整数格子上にあるため，産地・等級違いなどで行数が増えても
+    格子点の数は最大 6**6 にとどまり，1件あたりの計算量は行数ではなく格子点数で決まる．
+    """
+
+    name = "grid"
+
+    def __init__(self, index: CitrusIndex):
+        self.index = index
+        cells, inverse = np.unique(index.X, axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        self.cells = np.ascontiguousarray(cells)
+        self.sizes = np.bincount(inverse, minlength=len(cells))
+        self.starts = np.concatenate(([0], np.cumsum(self.sizes)))
+        # 格子点ごとに行番号を昇順で並べておく
+        self.members = np.argsort(inverse, kind="stable")
+
+    def query(self, P: np.ndarray, k: int, w: np.ndarray) -> np.ndarray:
+        _, cell_scores = _weighted_scores(self.cells, P, w)
+
+        # 各格子点には1件以上あるので，上位k件は必ずスコア上位k個の格子点に収まる
+        kk = min(k, len(self.cells))
+        out = np.empty((P.shape[0], k), dtype=np.intp)
+        for i, s in enumerate(cell_scores):
+            # スコアの高い格子点から k 件に達するまで取り，その境界と同点の格子点も含める
+            top = np.argpartition(-s, kk - 1)[:kk]
+            top = top[np.argsort(-s[top], kind="stable")]
+            reach = np.searchsorted(np.cumsum(self.sizes[top]), k)
+            chosen = np.flatnonzero(s >= s[top[min(reach, kk - 1)]])
+
+            cand = np.concatenate([self.members[self.starts[c]:self.starts[c + 1]] for c in chosen])
+            out[i] = _select_top_k(cand, np.repeat(s[chosen], self.sizes[chosen]), k)
+        return out
+
+
+NEIGHBOR_BACKENDS = {
+    "brute": BruteForceBackend,
+    "kdtree": lambda index: TreeBackend(index, kind="kdtree"),
+    "balltree": lambda index: TreeBackend(index, kind="balltree"),
+    "grid": GridBucketBackend,
+}
+
+# "auto" のときに brute から kdtree へ切り替える品種数．
+# bench/bench_neighbor_backends.py では数千行までは brute が最速で，
+# 1万行で kdtree が約2倍，5万行で約8倍速かった（grid は同じ特徴の行が多いときに有効）．
+AUTO_TREE_MIN_ITEMS = 5_000
+
+
+def make_backend(name: str, index: CitrusIndex):
+    """名前から近傍探索バックエンドを作る．"auto" は品種数で brute か kdtree を選ぶ．"""
+    if name == "auto":
+        name = "kdtree" if len(index) >= AUTO_TREE_MIN_ITEMS else "brute"
+    try:
+        factory = NEIGHBOR_BACKENDS[name]
+    except KeyError:
+        raise ValueError(
+            f"未知の近傍探索バックエンドである: {name!r}（{sorted(NEIGHBOR_BACKENDS)} または auto）"
+        ) from None
+    return factory(index)
+
+
+@st.cache_resource(max_entries=8, show_spinner=False)
+def _build_backend(r2_key: str | None, version: str, name: str):
+    return make_backend(name, _build_citrus_index(r2_key, version))
+
+
+def configured_backend_name() -> str:
+    """secrets.toml の neighbor_backend（省略時は brute）を返す．"""
+    return str(st.secrets.get("neighbor_backend", "brute"))
+
+
+def calculate_topk_batch(
+    prefs: np.ndarray,
+    k: int = 3,
+    weights: Dict[str, float] | None = None,
+    *,
+    r2_key: str | None = None,
+    index: CitrusIndex | None = None,
+    backend=None,
+) -> np.ndarray:
+    """
+    複数ユーザーの嗜好ベクトルをまとめて計算し，上位k件の品種IDを返す．
+
+    引数：
+        prefs   : (N, 6) の嗜好ベクトル（並びは calculate_top3_ids の引数と同じ）
+        k       : 返す件数
+        weights : 特徴ごとの重み（省略時は全て1）
+        r2_key  : R2 のオブジェクトキー（index 省略時に使用）
+        index   : 計算に使う CitrusIndex（オフライン評価などで直接渡す場合）
+        backend : 近傍探索バックエンド（名前かインスタンス）．省略時は，R2 から読む場合は
+                  secrets の neighbor_backend，index を直接渡す場合は brute を使う
+
+    戻り値：
+        (N, min(k, 品種数)) の品種ID配列．各行は calculate_top3_ids と同じ並び．
+
+    brute では距離をチャンクごとに1回のブロードキャスト演算で求め，1チャンクの展開量が
+    BATCH_MAX_ELEMENTS を超えないように行数を区切る．
+    """
+    if index is None:
+        version = _dataset_version(r2_key)
+        index = _build_citrus_index(r2_key, version)
+        if backend is None or isinstance(backend, str):
+            backend = _build_backend(r2_key, version, backend or configured_backend_name())
+    elif isinstance(backend, str):
+        backend = make_backend(backend, index)
+
+    return index.ids[topk_positions_batch(index, prefs, k, weights, backend=backend)]
+
+
+def topk_positions_batch(
+    index: CitrusIndex,
+    prefs: np.ndarray,
+    k: int = 3,
+    weights: Dict[str, float] | None = None,
+    *,
+    backend=None,
+) -> np.ndarray:
+    """calculate_topk_batch と同じ計算で，品種IDの代わりに index の行番号を返す．"""
+    P = np.asarray(prefs, dtype=np.float32)
+    if P.ndim != 2 or P.shape[1] != len(FEATURES):
+        raise ValueError(f"prefs は (N, {len(FEATURES)}) の配列であること: shape={P.shape}")
+
+    if backend is None:
+        backend = BruteForceBackend(index)
+
+    n_items = len(index)
+    k = max(0, min(k, n_items))
+    out = np.empty((P.shape[0], k), dtype=np.intp)
+    if k == 0 or P.shape[0] == 0:
+        return out
+
+    w = _feature_weights(weights, dtype=np.float32)
+    rows = max(1, BATCH_MAX_ELEMENTS // (n_items * len(FEATURES)))
+    for start in range(0, P.shape[0], rows):
+        out[start:start + rows] = backend.query(P[start:start + rows], k, w)
+
+    return out
+
+
+# ===== 全入力の事前計算表（任意） =====
+
+# 入力は6軸それぞれ1〜6の整数なので，組み合わせは 6**6 = 46,656 通りしかない
+PREF_LEVELS = 6
+ANSWER_TABLE_K = 3
+ANSWER_TABLE_DIR = ROOT_DIR / ".cache" / "answer_tables"
+
+_PREF_RADIX = PREF_LEVELS ** np.arange(len(FEATURES) - 1, -1, -1, dtype=np.int64)
+
+
+def preference_code(prefs) -> np.ndarray:
+    """嗜好ベクトル（各軸1〜6）を混合基数の通し番号 0〜6**6-1 へ変換する．(N, 6) も可．"""
+    return (np.asarray(prefs, dtype=np.int64) - 1) @ _PREF_RADIX
+
+
+def all_preferences() -> np.ndarray:
+    """全 6**6 通りの嗜好ベクトルを通し番号順に並べた (46656, 6) 配列を返す．"""
+    grid = np.indices((PREF_LEVELS,) * len(FEATURES), dtype=np.int8)
+    return grid.reshape(len(FEATURES), -1).T + 1
+
+
+def dataset_hash(index: CitrusIndex) -> str:
+    """インデックスの中身（特徴行列・ID・名前とその並び）から版に依存しないハッシュを作る．"""
+    h = hashlib.sha256()
+    h.update(index.X.tobytes())
+    h.update("\x1f".join(map(str, index.ids)).encode("utf-8"))
+    h.update("\x1f".join(index.names).encode("utf-8"))
+    return h.hexdigest()[:32]
+
+
+def build_answer_table(index: CitrusIndex, k: int = ANSWER_TABLE_K) -> np.ndarray:
+    """全入力の上位k件を (46656, k) の行番号表として計算する（重みは全て1）．"""
+    table = topk_positions_batch(index, all_preferences(), k)
+    dtype = np.int16 if len(index) <= np.iinfo(np.int16).max else np.int32
+    return table.astype(dtype)
+
+
+def load_answer_table(index: CitrusIndex, k: int = ANSWER_TABLE_K) -> np.ndarray:
+    """
+    ディスク上の事前計算表を読み込む．無ければ計算して保存する．
+
+    ファイル名はデータセットのハッシュで決まるので，R2 のデータが変わると自動的に別の表になる．
+    保存に失敗しても（読み取り専用の環境など）計算結果はそのまま返す．
+    """
+    path = ANSWER_TABLE_DIR / f"{dataset_hash(index)}_k{k}.npy"
+    expected = (PREF_LEVELS ** len(FEATURES), min(k, len(index)))
+
+    if path.exists():
+        try:
+            table = np.load(path, allow_pickle=False)
+            if table.shape == expected:
+                return table
+        except (OSError, ValueError):
+            pass
+
+    table = build_answer_table(index, k)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp, "wb") as f:
+            np.save(f, table)
+        os.replace(tmp, path)
+    except OSError:
+        pass
+    return table
+
+
+# 表を作るには数秒かかる（1万品種で約8秒）ので，診断の中では作らない．版ごとに
+# バックグラウンドのスレッドで作り，出来上がるまではその場で計算する
+ANSWER_TABLE_MAX_VERSIONS = 4
+ANSWER_TABLE_RETRY_SECONDS = 300
+
+_ANSWER_LOCK = threading.Lock()
+_ANSWER_TABLES = OrderedDict()  # (r2_key, version) -> 行番号表
+_ANSWER_BUILDS = {}  # (r2_key, version) -> {"thread", "started_at", "error"}
+
+
+def _build_answer_table(r2_key: str | None, version: str) -> None:
+    build_key = (r2_key, version)
+    try:
+        table = load_answer_table(_build_citrus_index(r2_key, version))
+        table.setflags(write=False)
+    except Exception as e:
+        with _ANSWER_LOCK:
+            _ANSWER_BUILDS[build_key]["error"] = f"{type(e).__name__}: {e}"
+        return
+
+    with _ANSWER_LOCK:
+        _ANSWER_TABLES[build_key] = table
+        while len(_ANSWER_TABLES) > ANSWER_TABLE_MAX_VERSIONS:
+            _ANSWER_TABLES.popitem(last=False)
+        del _ANSWER_BUILDS[build_key]
+
+
+def start_answer_table_build(r2_key: str | None, version: str) -> None:
+    """
+    版 version の事前計算表を作るスレッドを（必要なら）起動する．
+
+    出来上がっている・作成中なら何もしない．失敗したときは ANSWER_TABLE_RETRY_SECONDS
+    経ってから作り直す．
+    """
+    build_key = (r2_key, version)
+    with _ANSWER_LOCK:
+        if build_key in _ANSWER_TABLES:
+            return
+        build = _ANSWER_BUILDS.get(build_key)
+        if build is not None:
+            if build["thread"].is_alive():
+                return
+            if time.monotonic() - build["started_at"] < ANSWER_TABLE_RETRY_SECONDS:
+                return
+        thread = threading.Thread(
+            target=_build_answer_table, args=build_key, name="answer-table", daemon=True
+        )
+        _ANSWER_BUILDS[build_key] = {"thread": thread, "started_at": time.monotonic(), "error": ""}
+    thread.start()
+
+
+def get_answer_table(r2_key: str | None = None, version: str | None = None) -> np.ndarray | None:
+    """
+    R2 オブジェクトの版 version（省略時は現在の版）の事前計算表を返す．
+
+    まだ出来上がっていなければ None を返し，作るスレッドを起動する
+    （表は版ごとに別なので，返した表の行番号はその版の index でそのまま引ける）．
+    """
+    build_key = (r2_key, version or _dataset_version(r2_key))
+    with _ANSWER_LOCK:
+        table = _ANSWER_TABLES.get(build_key)
+        if table is not None:
+            _ANSWER_TABLES.move_to_end(build_key)
+            return table
+    start_answer_table_build(*build_key)
+    return None
+
+
+def answer_table_enabled() -> bool:
+    """secrets.toml の precompute_answers = true で事前計算表モードを有効にする．"""
+    return bool(st.secrets.get("precompute_answers", False))
+
+
+def score_items(
+    df: pd.DataFrame,
+    user_vec: np.ndarray,
+    season_pref: str = "",
+    weights: Dict[str, float] | None = None,
+    season_boost: float = 0.03,
+) -> pd.DataFrame:
+    """
+    類似度（スコア）を計算して降順ソートしたDataFrameを返す．
+
+    - user_vec: [brix, acid, bitterness, aroma, moisture, texture] の6次元ベクトル
+    - season_pref: "winter" などの希望季節（小文字・大文字は無視される）
+
+    全件の並びが必要な場合に使う．上位数件だけなら calculate_topk_batch を使うこと．
+    """
+    # 季節希望が一致する行のマスク（季節指定がなければ加点しない）
+    season_match = None
     season_pref_norm = season_pref.strip().lower()
-    add = np.zeros_like(scores)
     if season_pref_norm:
-        match = df["season"].fillna("").map(
+        season_match = df["season"].fillna("").map(
             lambda s: season_pref_norm in parse_seasons(s)
         ).to_numpy(dtype=bool)
-        add = np.where(match, season_boost, 0.0)
 
-    final = np.clip(scores + add, 0.0, 1.0)
+    X = df[FEATURES].to_numpy(dtype=float)
+    dists, final = _weighted_scores(
+        X,
+        user_vec,
+        _feature_weights(weights),
+        season_match=season_match,
+        season_boost=season_boost,
+    )
 
     out = df.copy()
     out["distance"] = dists
@@ -183,8 +552,134 @@ def score_items(
     return out.sort_values(["score", "name"], ascending=[False, True]).reset_index(drop=True)
 
 
+# ===== 推薦結果のメモ =====
+
+class ResultCache:
+    """
+    推薦結果（上位k件の品種ID）を覚えておく LRU + TTL のメモ．
+
+    キーは (R2 キー, データセットの版, 嗜好ベクトル, 重み)．嗜好ベクトルと重みは
+    計算と同じ float32 に丸めてから使うので，メモの有無で結果は変わらない．
+    版が変わったら（R2 のデータが更新されたら）その R2 キーの古い結果はまとめて捨てる．
+    """
+
+    def __init__(self, max_entries: int = 4096, ttl: float = 3600.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "expired": 0, "evicted": 0, "invalidated": 0}
+
+    @staticmethod
+    def make_key(r2_key, version: str, prefs, weights) -> tuple:
+        return (
+            r2_key,
+            version,
+            tuple(np.asarray(prefs, dtype=np.float32).tolist()),
+            tuple(np.asarray(weights, dtype=np.float32).tolist()),
+        )
+
+    def get(self, key: tuple):
+        r2_key, version = key[0], key[1]
+        now = time.monotonic()
+        with self._lock:
+            if self._versions.get(r2_key, version) != version:
+                stale = [k for k in self._entries if k[0] == r2_key]
+                for k in stale:
+                    del self._entries[k]
+                self._stats["invalidated"] += len(stale)
+            self._versions[r2_key] = version
+
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[0] >= self.ttl:
+                del self._entries[key]
+                self._stats["expired"] += 1
+                entry = None
+            if entry is None:
+                self._stats["misses"] += 1
+                CACHE_LOOKUPS.inc(cache="result_memo", result="miss")
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+        CACHE_LOOKUPS.inc(cache="result_memo", result="hit")
+        return entry[1]
+
+    def put(self, key: tuple, value: tuple) -> None:
+        with self._lock:
+            if self._versions.get(key[0], key[1]) != key[1]:
+                return  # 計算中に版が変わった
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evicted"] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats, entries=len(self._entries))
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+        return stats
+
+
+_RESULT_CACHES = {}
+_RESULT_CACHES_LOCK = threading.Lock()
+
+
+def get_result_cache() -> ResultCache | None:
+    """
+    secrets.toml の result_cache_size（既定 4096，0 で無効）と
+    result_cache_ttl（秒，既定 3600）に対応するプロセス共通のメモを返す．
+    """
+    size = int(st.secrets.get("result_cache_size", 4096))
+    ttl = float(st.secrets.get("result_cache_ttl", 3600))
+    if size <= 0:
+        return None
+    cache = _RESULT_CACHES.get((size, ttl))
+    if cache is None:
+        with _RESULT_CACHES_LOCK:
+            cache = _RESULT_CACHES.get((size, ttl))
+            if cache is None:
+                _RESULT_CACHES.clear()
+                cache = _RESULT_CACHES[(size, ttl)] = ResultCache(size, ttl)
+    return cache
+
+
+def result_cache_stats() -> dict:
+    """推薦結果のメモの件数・ヒット率などを返す（メモが無効なら空）．"""
+    with _RESULT_CACHES_LOCK:
+        caches = list(_RESULT_CACHES.values())
+    return caches[0].stats() if caches else {}
+
+
+def _collect_result_cache_metrics() -> list:
+    """
+    推薦結果のメモの件数と，メモから消えた理由ごとの件数を metrics に出す．
+    ヒット／ミスは CACHE_LOOKUPS（cache="result_memo"）で出している．
+    """
+    stats = result_cache_stats()
+    if not stats:
+        return []
+    return [
+        ("result_memo_entries", "gauge", "推薦結果のメモに入っている件数", [({}, stats["entries"])]),
+        ("result_memo_removals_total", "counter",
+         "推薦結果のメモから消えた件数（reason は expired / evicted / invalidated）",
+         [({"reason": r}, stats[r]) for r in ("expired", "evicted", "invalidated")]),
+    ]
+
+
+register_collector("result_memo", _collect_result_cache_metrics)
+
+
 # ===== 外部公開用：上位3品種IDを返す関数 =====
 
+_SCORING_SECONDS = histogram(
+    "scoring_seconds", "calculate_top3_ids の所要時間（source は memo / computed）", ("source",)
+)
+
+
+@traced()
 def calculate_top3_ids(
     sweetness: int,
     sourness: int,
@@ -210,26 +705,52 @@ def calculate_top3_ids(
     戻り値：
         上位3件（行数が3未満ならその分だけ）の品種IDを格納したリスト
     """
-    # R2 から特徴量を取得
-    df = _prepare_dataframe(r2_key)
-
-    # ユーザー嗜好ベクトル（app_old.py と同じ並び）
-    user_vec = np.array(
-        [sweetness, sourness, bitterness, aroma, juiciness, texture],
-        dtype=float,
-    )
+    t0 = time.perf_counter()
+    prefs = [sweetness, sourness, bitterness, aroma, juiciness, texture]
 
     # 重みはとりあえず全て1．必要になったら引数に出してもよい
     weights = {k: 1.0 for k in FEATURES}
 
-    # 季節入力は廃止したため、season_pref は常に空文字として扱う
-    ranked = score_items(
-        df,
-        user_vec,
-        season_pref="",
-        weights=weights,
-    )
+    # 版はここで1回だけ決め，メモのキーと計算の両方に使う（途中で R2 が更新されても混ざらない）
+    version = _dataset_version(r2_key)
+
+    # 同じ嗜好・重み・データセットの版なら前回の結果を返す
+    cache = get_result_cache()
+    if cache is not None:
+        key = ResultCache.make_key(r2_key, version, prefs, _feature_weights(weights))
+        cached = cache.get(key)
+        if cached is not None:
+            _SCORING_SECONDS.observe(time.perf_counter() - t0, source="memo")
+            return list(cached)
+
+    top_ids = _compute_top3_ids(prefs, weights, r2_key, version)
+    if cache is not None:
+        cache.put(key, tuple(top_ids))
+    _SCORING_SECONDS.observe(time.perf_counter() - t0, source="computed")
+    return top_ids
+
+
+@traced()
+def _compute_top3_ids(
+    prefs: list, weights: Dict[str, float], r2_key: str | None, version: str
+) -> List[int]:
+    """calculate_top3_ids の本体（メモを通さずに，版 version のインデックスで計算する）．"""
+    index = _build_citrus_index(r2_key, version)
+
+    # 事前計算表モードでは表引き1回で済ませる（入力が1〜6の整数で，表が出来上がっているときのみ）
+    if answer_table_enabled() and all(
+        isinstance(v, (int, np.integer)) and 1 <= v <= PREF_LEVELS for v in prefs
+    ):
+        table = get_answer_table(r2_key, version)
+        if table is not None:
+            return index.ids[table[preference_code(prefs)]].tolist()
+
+    # ユーザー嗜好ベクトル（app_old.py と同じ並び）
+    user_vec = np.array([prefs], dtype=np.float32)
+
+    # 季節入力は廃止したため，1人分のバッチとして計算する
+    backend = _build_backend(r2_key, version, configured_backend_name())
+    top_ids = calculate_topk_batch(user_vec, k=3, weights=weights, index=index, backend=backend)
 
     # 上位3件のidをリストで返す（行数が足りない場合はその分だけ）
-    top_ids = ranked["id"].head(3).tolist()
-    return top_ids
+    return top_ids[0].tolist()
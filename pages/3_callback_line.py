@@ -1,8 +1,16 @@
 # pages/3_callback_line.py
-import requests
+import sys
+from pathlib import Path
+
 import jwt
 import streamlit as st
 
+ROOT_DIR = Path(__file__).resolve().parent.parent
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+import http_client
+
 st.set_page_config(page_title="LINEログイン処理中", page_icon="🔑")
 
 LINE_CLIENT_ID = st.secrets["LINE_CHANNEL_ID"]
@@ -59,7 +67,7 @@ data = {
     "client_secret": LINE_CLIENT_SECRET,
 }
 
-res = requests.post(token_url, headers=headers, data=data)
+res = http_client.post(token_url, headers=headers, data=data)
 
 if res.status_code != 200:
     st.error(f"トークン取得に失敗しました（HTTP {res.status_code}）")
@@ -1,8 +1,15 @@
 # pages/3_line_oauth.py
-import requests
-import jwt
+import sys
+from pathlib import Path
+
 import streamlit as st
 
+ROOT_DIR = Path(__file__).resolve().parent.parent
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+import http_client
+
 def handle_line_oauth():
     params = st.query_params
 
@@ -18,8 +25,11 @@ def handle_line_oauth():
         return
     st.session_state["line_last_code"] = code
 
-    # トークン交換
-    res = requests.post(
+    # 通常アクセスでは使わないので，コールバックのときだけ読み込む
+    import jwt
+
+    # トークン交換（接続はログ送信などと共通のプールを使う）
+    res = http_client.post(
         "https://api.line.me/oauth2/v2.1/token",
         headers={"Content-Type": "application/x-www-form-urlencoded"},
         data={
@@ -0,0 +1,298 @@
+# perf_trace.py
+"""
+スクリプトの実行時間と，その中の処理ごとの所要時間（スパン）を記録する計測層．
+
+Streamlit はボタンを押すたびにスクリプトを再実行する．どの操作がどれだけの
+再実行を起こしているかを見るため，
+
+- app.py の1回の実行（scope = "app"）
+- @timed_fragment を付けたフラグメントの実行（scope = "fragment:<名前>"）
+
+の所要時間を (ルート, scope) ごとに集計する（run_stats．常に有効）．
+フラグメントはアプリ全体の実行の一部として走ることもあるので，
+フラグメントだけの再実行は別に fragment_reruns として数える．
+
+さらに trace_enabled = true のときは，span() / @traced で囲んだ処理
+（OAuth の確認，ページの描画，R2 からの取得，推薦計算，レーダーチャート，ログ送信など）の
+所要時間を (実行番号, ルート, 名前, 深さ) 付きでリングバッファに残す．
+無効のときは span() は共有の空のコンテキストを返し，@traced は元の関数をそのまま呼ぶだけなので，
+ほぼ計測の負担はない．
+
+secrets.toml で調整できる項目（いずれも省略可）：
+    trace_enabled     : スパンを記録する（既定 false）
+    trace_buffer_size : リングバッファに残すスパンの数（既定 5000）
+    trace_debug_key   : URL に ?debug=<この値> を付けるとサイドバーに計測パネルを出す
+                        （既定は未設定で，そのときは出さない．推測されにくい値にする．
+                        trace_enabled が false のときも出さない）
+
+dump_jsonl() で記録を .cache/trace.jsonl に追記できる（計測パネルのボタンからも書き出せる）．
+"""
+import contextlib
+import functools
+import itertools
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from pathlib import Path
+
+import streamlit as st
+
+from metrics import metrics_snapshot
+
+ROOT_DIR = Path(__file__).resolve().parent
+TRACE_PATH = ROOT_DIR / ".cache" / "trace.jsonl"
+DEFAULT_BUFFER_SIZE = 5000
+
+_LOCK = threading.Lock()
+_RUNS = {}
+
+_ENABLED = False
+_BUFFER = deque(maxlen=DEFAULT_BUFFER_SIZE)
+_RUN_IDS = itertools.count(1)
+_CTX = threading.local()
+_NULL = contextlib.nullcontext()
+
+
+def _setting(name: str, default):
+    try:
+        return st.secrets.get(name, default)
+    except FileNotFoundError:  # secrets.toml が無い（ベンチなど）ときは既定値
+        return default
+
+
+def configure(enabled: bool | None = None, buffer_size: int | None = None) -> None:
+    """
+    スパンの記録を有効・無効にする．省略した項目は secrets.toml から読む．
+
+    app.py の実行ごとに script_run() から呼ばれるので，secrets の変更は次の実行から反映される．
+    """
+    global _ENABLED, _BUFFER
+    if enabled is None:
+        enabled = bool(_setting("trace_enabled", False))
+    if buffer_size is None:
+        buffer_size = int(_setting("trace_buffer_size", DEFAULT_BUFFER_SIZE))
+    with _LOCK:
+        if buffer_size != _BUFFER.maxlen:
+            _BUFFER = deque(_BUFFER, maxlen=buffer_size)
+        _ENABLED = enabled
+
+
+def tracing_enabled() -> bool:
+    return _ENABLED
+
+
+# ===== 実行ごとの集計 =====
+
+def _record(route: str, scope: str, seconds: float, fragment_rerun: bool = False) -> None:
+    ms = seconds * 1e3
+    with _LOCK:
+        s = _RUNS.setdefault(
+            (route, scope),
+            {"count": 0, "fragment_reruns": 0, "total_ms": 0.0, "max_ms": 0.0, "last_ms": 0.0},
+        )
+        s["count"] += 1
+        s["fragment_reruns"] += int(fragment_rerun)
+        s["total_ms"] += ms
+        s["max_ms"] = max(s["max_ms"], ms)
+        s["last_ms"] = ms
+
+
+def _is_fragment_rerun() -> bool:
+    """いまの実行がフラグメントだけの再実行なら True．"""
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+        ctx = get_script_run_ctx()
+        return bool(ctx and ctx.fragment_ids_this_run)
+    except Exception:
+        return False
+
+
+def _begin_run(route: str) -> None:
+    """このスレッドで以降に記録するスパンの実行番号とルートを決める．"""
+    _CTX.run = next(_RUN_IDS)
+    _CTX.route = route
+    _CTX.depth = 0
+
+
+@contextmanager
+def script_run(route: str):
+    """
+    with の中身をアプリ全体の1回の実行として計測する．
+
+    st.rerun() / st.stop() で抜けた場合も記録する．
+    """
+    configure()
+    _begin_run(route)
+    t0 = time.perf_counter()
+    try:
+        with span("run"):
+            yield
+    finally:
+        _record(route, "app", time.perf_counter() - t0)
+
+
+def timed_fragment(name: str):
+    """
+    st.fragment と同じように使うデコレータ．フラグメントの実行時間も記録する．
+
+    フラグメント内のウィジェットを操作したときは，この関数だけが再実行される．
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            route = str(st.session_state.get("route", ""))
+            fragment_rerun = _is_fragment_rerun()
+            if fragment_rerun:
+                _begin_run(route)
+            t0 = time.perf_counter()
+            try:
+                with span(f"fragment:{name}"):
+                    return func(*args, **kwargs)
+            finally:
+                _record(route, f"fragment:{name}", time.perf_counter() - t0, fragment_rerun)
+
+        return st.fragment(wrapper)
+
+    return decorator
+
+
+def run_stats() -> dict:
+    """(ルート, scope) ごとの実行回数と所要時間（ms）を返す．"""
+    with _LOCK:
+        runs = {k: dict(v) for k, v in _RUNS.items()}
+    for s in runs.values():
+        total_ms = s.pop("total_ms")
+        s["avg_ms"] = round(total_ms / s["count"], 2) if s["count"] else 0.0
+        s["max_ms"] = round(s["max_ms"], 2)
+        s["last_ms"] = round(s["last_ms"], 2)
+    return {f"{route}/{scope}": s for (route, scope), s in sorted(runs.items())}
+
+
+# ===== スパン =====
+
+class _Span:
+    __slots__ = ("name", "t0")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        _CTX.depth = getattr(_CTX, "depth", 0) + 1
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        t1 = time.perf_counter()
+        depth = _CTX.depth = _CTX.depth - 1
+        _BUFFER.append((
+            time.time(),
+            getattr(_CTX, "run", 0),
+            getattr(_CTX, "route", ""),
+            self.name,
+            (t1 - self.t0) * 1e3,
+            depth,
+            threading.current_thread().name,
+        ))
+        return False
+
+
+def span(name: str):
+    """with span("名前"): で囲んだ処理の所要時間を記録する（無効なら何もしない）．"""
+    return _Span(name) if _ENABLED else _NULL
+
+
+def traced(name: str | None = None):
+    """関数全体を span で囲むデコレータ．name を省略すると関数名を使う．"""
+
+    def decorator(func):
+        label = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _ENABLED:
+                return func(*args, **kwargs)
+            with _Span(label):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+_FIELDS = ("ts", "run", "route", "name", "ms", "depth", "thread")
+
+
+def recent_spans(limit: int | None = None) -> list:
+    """リングバッファのスパンを古い順に dict で返す（limit を指定すると新しい方から limit 件）．"""
+    with _LOCK:
+        rows = list(_BUFFER)
+    if limit is not None:
+        rows = rows[-limit:]
+    return [dict(zip(_FIELDS, row)) for row in rows]
+
+
+def dump_jsonl(path: Path = TRACE_PATH, clear: bool = True) -> int:
+    """リングバッファのスパンを JSONL で追記し，書き出した件数を返す．clear なら書き出した分を消す．"""
+    # 取り出しと消去は1回のロックの中で行う（間に追加されたスパンを書かずに消さないように）
+    with _LOCK:
+        rows = list(_BUFFER)
+        if clear:
+            _BUFFER.clear()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a", encoding="utf-8") as f:
+        for row in rows:
+            f.write(json.dumps(dict(zip(_FIELDS, row)), ensure_ascii=False) + "\n")
+    return len(rows)
+
+
+def summarize_spans(rows: list) -> list:
+    """(ルート, 名前) ごとの回数・平均・最大（ms）を平均の降順で返す．"""
+    groups = {}
+    for r in rows:
+        g = groups.setdefault((r["route"], r["name"]), [])
+        g.append(r["ms"])
+    out = [
+        {"route": route, "name": name, "count": len(ms), "avg_ms": round(sum(ms) / len(ms), 2),
+         "max_ms": round(max(ms), 2)}
+        for (route, name), ms in groups.items()
+    ]
+    return sorted(out, key=lambda r: -r["avg_ms"])
+
+
+def debug_panel_requested() -> bool:
+    """
+    計測パネルを出すか（trace_enabled かつ URL に ?debug=<trace_debug_key> があるとき）．
+
+    trace_debug_key が未設定・空なら出さない（誰でも開ける既定の値は持たない）．
+    """
+    if not _ENABLED:
+        return False
+    key = str(_setting("trace_debug_key", "") or "")
+    return bool(key) and st.query_params.get("debug") == key
+
+
+def render_debug_panel() -> None:
+    """サイドバーの計測パネル（直近の実行のスパンと，スパン・実行ごとの集計）．"""
+    rows = recent_spans()
+    with st.sidebar.expander("⏱ 計測", expanded=False):
+        # いまの実行はまだ終わっていないので，最上位のスパンが閉じた最後の実行を出す
+        last_run = max((r["run"] for r in rows if r["depth"] == 0), default=0)
+        st.caption(f"スパン {len(rows)} 件（上限 {_BUFFER.maxlen}）")
+        st.markdown("**直前の実行**")
+        st.table([
+            {"name": "　" * r["depth"] + r["name"], "ms": round(r["ms"], 2)}
+            for r in rows if r["run"] == last_run
+        ])
+        st.markdown("**スパンごと**")
+        st.table(summarize_spans(rows))
+        st.markdown("**実行ごと**")
+        st.json(run_stats(), expanded=False)
+        st.markdown("**メトリクス**")
+        st.json(metrics_snapshot()["metrics"], expanded=False)
+        if st.button("JSONL に書き出す", key="perf_trace_dump"):
+            n = dump_jsonl()
+            st.caption(f"{n} 件を {TRACE_PATH.relative_to(ROOT_DIR)} に書き出した")
@@ -0,0 +1,147 @@
+# r2_client.py
+"""
+Cloudflare R2 へアクセスするプロセス共通の boto3 クライアント．
+
+以前は各ローダがキャッシュミスのたびに boto3.client() を作っていたため，
+セッション生成・エンドポイント解決・TLSハンドシェイクを毎回やり直していた．
+ここでは接続プール付きのクライアントを1つだけ作り，全ローダで使い回す．
+
+secrets.toml で調整できる項目（いずれも省略可）：
+    r2_max_pool_connections : 接続プールの上限（既定 10）
+    r2_max_attempts         : リトライを含めた最大試行回数（既定 3）
+    r2_connect_timeout      : 接続タイムアウト秒（既定 5）
+    r2_read_timeout         : 読み込みタイムアウト秒（既定 30）
+"""
+import threading
+
+import boto3
+from botocore.config import Config
+import streamlit as st
+
+from metrics import register_collector
+
+REQUIRED_SECRETS = ("r2_account_id", "r2_access_key_id", "r2_secret_access_key", "r2_bucket")
+
+_LOCK = threading.Lock()
+_CLIENTS = {}
+_REQUESTS = {"count": 0}
+
+
+def _check_secrets() -> None:
+    missing = [k for k in REQUIRED_SECRETS if k not in st.secrets]
+    if missing:
+        raise RuntimeError(
+            f"R2の接続情報が見つからない．.streamlit/secrets.toml に {missing} を設定すること．"
+        )
+
+
+def r2_bucket() -> str:
+    """R2 のバケット名を返す．"""
+    _check_secrets()
+    return st.secrets["r2_bucket"]
+
+
+def _count_request(**kwargs) -> None:
+    with _LOCK:
+        _REQUESTS["count"] += 1
+
+
+def get_r2_client():
+    """
+    プロセス共通の R2 クライアントを返す．
+
+    接続情報やプール設定が変わったときだけ作り直す．boto3 のクライアントは
+    スレッドセーフなので，全セッション・全スレッドで同じものを使ってよい．
+    """
+    _check_secrets()
+    settings = (
+        st.secrets["r2_account_id"],
+        st.secrets["r2_access_key_id"],
+        st.secrets["r2_secret_access_key"],
+        int(st.secrets.get("r2_max_pool_connections", 10)),
+        int(st.secrets.get("r2_max_attempts", 3)),
+        float(st.secrets.get("r2_connect_timeout", 5)),
+        float(st.secrets.get("r2_read_timeout", 30)),
+    )
+
+    client = _CLIENTS.get(settings)
+    if client is not None:
+        return client
+
+    with _LOCK:
+        client = _CLIENTS.get(settings)
+        if client is not None:
+            return client
+
+        account_id, key_id, secret, pool, attempts, connect_timeout, read_timeout = settings
+        # boto3 のデフォルトセッションはスレッドセーフではないので専用のセッションから作る
+        client = boto3.session.Session().client(
+            "s3",
+            endpoint_url=f"https://{account_id}.r2.cloudflarestorage.com",
+            aws_access_key_id=key_id,
+            aws_secret_access_key=secret,
+            config=Config(
+                max_pool_connections=pool,
+                retries={"total_max_attempts": attempts, "mode": "standard"},
+                connect_timeout=connect_timeout,
+                read_timeout=read_timeout,
+                tcp_keepalive=True,
+            ),
+        )
+        client.meta.events.register("before-send.s3", _count_request)
+
+        _CLIENTS.clear()
+        _CLIENTS[settings] = client
+
+    return client
+
+
+def _open_pools(client) -> list:
+    """クライアント内部の urllib3 接続プールを返す（取得できなければ空リスト）．"""
+    try:
+        manager = client._endpoint.http_session._manager
+        return [manager.pools[key] for key in manager.pools.keys()]
+    except (AttributeError, KeyError):
+        return []
+
+
+def r2_connection_stats() -> dict:
+    """
+    接続の再利用状況を返す．
+
+    requests        : R2 へ送ったリクエスト数（リトライを含む）
+    new_connections : 新しく張った TCP/TLS 接続の数
+    reuse_ratio     : 既存の接続を使い回したリクエストの割合
+    """
+    with _LOCK:
+        requests_sent = _REQUESTS["count"]
+        clients = list(_CLIENTS.values())
+
+    new_connections = sum(
+        getattr(pool, "num_connections", 0) for client in clients for pool in _open_pools(client)
+    )
+    reuse_ratio = 0.0
+    if requests_sent:
+        reuse_ratio = max(0.0, 1.0 - new_connections / requests_sent)
+
+    return {
+        "requests": requests_sent,
+        "new_connections": new_connections,
+        "reuse_ratio": round(reuse_ratio, 3),
+    }
+
+
+def _collect_r2_connection_metrics() -> list:
+    """r2_connection_stats() の値を metrics に出す．"""
+    stats = r2_connection_stats()
+    return [
+        ("r2_client_requests_total", "counter", "R2 へ送ったリクエスト数（リトライを含む）",
+         [({}, stats["requests"])]),
+        ("r2_client_new_connections", "gauge", "R2 との接続プールで新しく張った TCP/TLS 接続の数",
+         [({}, stats["new_connections"])]),
+        ("r2_client_reuse_ratio", "gauge", "既存の接続を使い回したリクエストの割合",
+         [({}, stats["reuse_ratio"])]),
+    ]
+
+
+register_collector("r2_client", _collect_r2_connection_metrics)
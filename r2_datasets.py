@@ -0,0 +1,174 @@
+# r2_datasets.py
+"""
+R2 上のデータセット（CSV/XLSX）を版（ETag）単位で管理する層．
+
+@st.cache_data(ttl=3600) では，1時間ごとに中身が変わっていなくても全体を
+読み直してパースし，逆に変更は最大1時間反映されなかった．ここでは
+一定間隔ごとに If-None-Match 付きの GET で版だけを確認し，
+
+- 変わっていなければ（304）パース済みのデータをそのまま使い回す
+- 変わっていれば読み直し，パースが終わってから新しい版へまとめて差し替える
+
+ので，転送量を減らしつつ変更も早く反映できる．
+
+secrets.toml で調整できる項目（省略可）：
+    r2_revalidate_seconds : 版を確認する間隔（秒，既定 60）
+"""
+import threading
+import time
+from typing import Any, Callable, NamedTuple
+
+from botocore.exceptions import ClientError
+import streamlit as st
+
+from metrics import CACHE_LOOKUPS, counter, histogram, register_collector
+from perf_trace import span
+from r2_client import get_r2_client, r2_bucket
+
+
+class Dataset(NamedTuple):
+    """パース済みのデータとその版．data は全セッションで共有されるので書き換えないこと．"""
+
+    version: str
+    data: Any
+    checked_at: float
+
+
+_LOCK = threading.Lock()
+_KEY_LOCKS = {}
+_STORE = {}
+_STATS = {
+    "full_downloads": 0,
+    "not_modified": 0,
+    "bytes_downloaded": 0,
+    "stale_served": 0,
+    "last_error": "",
+}
+
+_R2_REQUESTS = counter("r2_requests_total", "R2 への GET（result は ok / not_modified / error）", ("key", "result"))
+_R2_BYTES = counter("r2_bytes_total", "R2 から受け取った本文のバイト数", ("key",))
+_R2_SECONDS = histogram("r2_request_seconds", "R2 への GET の所要時間（本文の受信を含む）", ("key",))
+
+
+def _revalidate_seconds() -> float:
+    return float(st.secrets.get("r2_revalidate_seconds", 60))
+
+
+def _key_lock(store_key) -> threading.Lock:
+    with _LOCK:
+        return _KEY_LOCKS.setdefault(store_key, threading.Lock())
+
+
+def _is_not_modified(e: ClientError) -> bool:
+    status = e.response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+    code = str(e.response.get("Error", {}).get("Code", ""))
+    return status == 304 or code in ("304", "NotModified")
+
+
+def _bump(name: str, amount: int = 1) -> None:
+    with _LOCK:
+        _STATS[name] += amount
+
+
+def load_dataset(key: str, parser: Callable[[bytes], Any]) -> Dataset:
+    """
+    R2 オブジェクト key を parser でパースした結果を Dataset として返す．
+
+    前回の確認から r2_revalidate_seconds 以内なら R2 へは問い合わせない．
+    それを過ぎていれば条件付き GET で版を確認し，変わっていたときだけ読み直す．
+    確認に失敗した場合は，前回のデータがあればそれを返し，次の間隔で再確認する．
+    """
+    store_key = (r2_bucket(), key, getattr(parser, "__qualname__", repr(parser)))
+    entry = _STORE.get(store_key)
+    if entry is not None and time.monotonic() - entry.checked_at < _revalidate_seconds():
+        CACHE_LOOKUPS.inc(cache=f"dataset:{key}", result="hit")
+        return entry
+
+    # 同じデータセットの確認は1スレッドだけが行い，他はその結果を待つ
+    with _key_lock(store_key):
+        entry = _STORE.get(store_key)
+        now = time.monotonic()
+        if entry is not None and now - entry.checked_at < _revalidate_seconds():
+            CACHE_LOOKUPS.inc(cache=f"dataset:{key}", result="hit")
+            return entry
+
+        kwargs = {"Bucket": store_key[0], "Key": key}
+        if entry is not None and entry.version:
+            kwargs["IfNoneMatch"] = entry.version
+
+        t0 = time.perf_counter()
+        try:
+            with span(f"r2:get_object:{key}"):
+                obj = get_r2_client().get_object(**kwargs)
+        except Exception as e:
+            _R2_SECONDS.observe(time.perf_counter() - t0, key=key)
+            not_modified = isinstance(e, ClientError) and _is_not_modified(e)
+            _R2_REQUESTS.inc(key=key, result="not_modified" if not_modified else "error")
+            if entry is None:
+                CACHE_LOOKUPS.inc(cache=f"dataset:{key}", result="miss")
+                raise
+            if not_modified:
+                _bump("not_modified")
+                _clear_last_error()
+                CACHE_LOOKUPS.inc(cache=f"dataset:{key}", result="revalidated")
+            else:
+                _record_stale(e)
+                CACHE_LOOKUPS.inc(cache=f"dataset:{key}", result="stale")
+            entry = entry._replace(checked_at=now)
+            _STORE[store_key] = entry
+            return entry
+
+        with span(f"r2:read:{key}"):
+            body = obj["Body"].read()
+        _R2_SECONDS.observe(time.perf_counter() - t0, key=key)
+        _R2_REQUESTS.inc(key=key, result="ok")
+        _R2_BYTES.inc(len(body), key=key)
+        CACHE_LOOKUPS.inc(cache=f"dataset:{key}", result="miss")
+        _bump("full_downloads")
+        _bump("bytes_downloaded", len(body))
+        _clear_last_error()
+
+        # パースが終わってから差し替えるので，読み手は常に版とデータが揃った状態を見る
+        with span(f"parse:{key}"):
+            data = parser(body)
+        entry = Dataset(version=str(obj.get("ETag", "")), data=data, checked_at=now)
+        _STORE[store_key] = entry
+        return entry
+
+
+def _record_stale(error: Exception) -> None:
+    with _LOCK:
+        _STATS["stale_served"] += 1
+        _STATS["last_error"] = f"{type(error).__name__}: {error}"
+
+
+def _clear_last_error() -> None:
+    """R2 から応答を得られたら，直近のエラーを消す（last_error は直近の失敗だけを表す）．"""
+    with _LOCK:
+        _STATS["last_error"] = ""
+
+
+def dataset_stats() -> dict:
+    """全文取得・304・転送バイト数などの集計を返す．"""
+    with _LOCK:
+        stats = dict(_STATS)
+        stats["datasets"] = {f"{k[1]} ({k[2]})": e.version for k, e in _STORE.items()}
+    return stats
+
+
+def _collect_dataset_metrics() -> list:
+    """
+    dataset_stats() のうち，r2_requests_total・r2_bytes_total で出していない値を metrics に出す．
+    """
+    stats = dataset_stats()
+    return [
+        ("r2_stale_served_total", "counter", "R2 に届かず手元の古いデータセットを使った回数",
+         [({}, stats["stale_served"])]),
+        ("r2_last_error", "gauge", "直近に R2 へのアクセスが失敗していたか（1 なら失敗あり）",
+         [({}, int(bool(stats["last_error"])))]),
+        ("r2_datasets_loaded", "gauge", "メモリに持っているデータセットの数",
+         [({}, len(stats["datasets"]))]),
+    ]
+
+
+register_collector("r2_datasets", _collect_dataset_metrics)
@@ -0,0 +1,353 @@
+# radar_charts.py
+"""
+結果カードのレーダーチャート（6軸）を作る層．
+
+secrets.toml の radar_backend で描き方を選ぶ（既定 svg）：
+    svg : 6軸の多角形を SVG で直接組み立て，1〜2KB の data URL として埋め込む．
+          matplotlib は使わない．
+    png : matplotlib で描いた PNG を事前に用意して参照する（以下）．
+
+以前は結果ページの初回表示で，カードごとに matplotlib（dpi=220）で描画していたため，
+起動直後は1枚あたり数百ミリ秒かかっていた．ここでは
+
+- 特徴量の組（と見出し）ごとに1回だけ PNG を描き，static/radar/ に保存する
+- アプリ起動時（と特徴量CSVの版が変わったとき）に，カタログ全品種の分を
+  バックグラウンドで描いておく（start_radar_warmup）
+- 結果ページは保存済みの PNG を URL（静的配信が無効なら data URL）で参照するだけ
+
+ので，通常のリクエストで matplotlib を呼ぶことは無い．warm-up が終わる前に
+来たリクエストだけは，その場で描いて保存する．
+
+事前にまとめて描く場合：
+    python radar_charts.py
+"""
+import base64
+import hashlib
+import html
+import math
+import os
+import threading
+import time
+import warnings
+from io import BytesIO
+from pathlib import Path
+
+import streamlit as st
+
+from metrics import CACHE_LOOKUPS, IMAGE_PAYLOAD_BYTES, register_collector
+from perf_trace import traced
+
+ROOT_DIR = Path(__file__).resolve().parent
+FONT_PATH = ROOT_DIR / "fonts" / "NotoSansJP-Regular.ttf"
+
+RADAR_DIR = ROOT_DIR / "static" / "radar"
+RADAR_URL = "app/static/radar"
+RADAR_TITLE = "この品種の特徴"
+RADAR_LABELS = ["甘さ", "酸味", "苦味", "香り", "ジューシーさ", "食感"]
+
+# 表示幅 300px の2倍程度になる解像度．見た目を変えたら RADAR_FORMAT を上げる
+RADAR_DPI = 130
+RADAR_FORMAT = 1
+
+# 版の確認（warm-up の再実行）をする間隔（秒）
+WARMUP_INTERVAL = 300
+
+RADAR_BACKENDS = ("svg", "png")
+
+_LOCK = threading.Lock()
+_RENDER_LOCK = threading.Lock()
+_INLINE = {}
+_WARMUP = {"thread": None, "started_at": 0.0, "version": "", "rendered": 0, "error": ""}
+
+
+def _font_prop():
+    from matplotlib import font_manager
+
+    if not FONT_PATH.exists():
+        return None
+    font_manager.fontManager.addfont(str(FONT_PATH))
+    return font_manager.FontProperties(fname=str(FONT_PATH))
+
+
+def render_radar_png(values, title: str = "") -> bytes:
+    """6軸の値（1〜6）からレーダーチャートの PNG を描く．"""
+    # pyplot はスレッドセーフではないので Figure を直接使う．PNG 版のときだけ読み込む
+    from matplotlib.figure import Figure
+    import numpy as np
+
+    fp = _font_prop()
+
+    values = list(values) + [values[0]]
+    angles = np.linspace(0, 2 * np.pi, len(RADAR_LABELS), endpoint=False).tolist()
+    angles = angles + [angles[0]]
+
+    fig = Figure(figsize=(4.6, 4.0), dpi=RADAR_DPI)
+    ax = fig.add_subplot(111, polar=True)
+
+    line_color = "#F59E0B"
+    fill_color = "#FDBA74"
+    grid_color = "#E7D7C5"
+    text_color = "#4B3B2B"
+
+    ax.set_facecolor("#FFF7ED")
+    ax.grid(color=grid_color, linewidth=1.0, alpha=0.9)
+    ax.spines["polar"].set_color("#E8B26A")
+    ax.spines["polar"].set_linewidth(1.4)
+
+    ax.plot(angles, values, linewidth=2.4, color=line_color)
+    ax.fill(angles, values, color=fill_color, alpha=0.35)
+
+    ax.set_xticks(angles[:-1])
+    ax.set_xticklabels(RADAR_LABELS, fontsize=10, color=text_color, fontproperties=fp)
+
+    ax.set_ylim(1, 6)
+    ax.set_yticks([1, 2, 3, 4, 5, 6])
+    ax.set_yticklabels(["1", "2", "3", "4", "5", "6"], fontsize=9, color=text_color)
+    ax.set_rlabel_position(22)
+
+    if title:
+        ax.set_title(title, fontsize=11, pad=8, color=text_color, fontproperties=fp)
+
+    fig.tight_layout(pad=0.35)
+    buf = BytesIO()
+    fig.savefig(buf, format="png", bbox_inches="tight", transparent=True)
+    return buf.getvalue()
+
+
+def radar_key(values, title: str = RADAR_TITLE) -> str:
+    src = f"{RADAR_FORMAT}|{RADAR_DPI}|{','.join(map(str, values))}|{title}"
+    return hashlib.sha1(src.encode("utf-8")).hexdigest()[:20]
+
+
+def _as_values(values) -> tuple:
+    """6軸の値を整数のタプルにする（欠損などで変換できなければ ValueError/TypeError）．"""
+    values = tuple(int(v) for v in values)
+    if len(values) != len(RADAR_LABELS):
+        raise ValueError(f"レーダーチャートには {len(RADAR_LABELS)} 個の値が必要: {values}")
+    return values
+
+
+def ensure_radar(values, title: str = RADAR_TITLE) -> Path:
+    """values の PNG がディスクに無ければ描いて保存し，そのパスを返す．"""
+    values = _as_values(values)
+    path = RADAR_DIR / f"{radar_key(values, title)}.png"
+    if path.exists():
+        CACHE_LOOKUPS.inc(cache="radar_png", result="hit")
+        return path
+
+    CACHE_LOOKUPS.inc(cache="radar_png", result="miss")
+    with _RENDER_LOCK:
+        if not path.exists():
+            png = render_radar_png(values, title)
+            RADAR_DIR.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix(f".{os.getpid()}.tmp")
+            tmp.write_bytes(png)
+            os.replace(tmp, path)
+    return path
+
+
+def _static_serving_enabled() -> bool:
+    return bool(st.get_option("server.enableStaticServing"))
+
+
+def _inline_url(path: Path) -> str:
+    url = _INLINE.get(path.name)
+    if url is None:
+        url = f"data:image/png;base64,{base64.b64encode(path.read_bytes()).decode('utf-8')}"
+        _INLINE[path.name] = url
+    return url
+
+
+# ===== SVG =====
+
+SVG_WIDTH = 300
+SVG_HEIGHT = 272
+SVG_CENTER = (150.0, 146.0)
+SVG_RADIUS = 92.0
+SVG_FONT = "Noto Sans JP, Hiragino Sans, Yu Gothic, Meiryo, sans-serif"
+
+# data URL に入れるときに最低限エスケープする文字（日本語はそのまま残して短く保つ）
+_SVG_URL_ESCAPES = str.maketrans({"%": "%25", "#": "%23", "<": "%3C", ">": "%3E", '"': "'"})
+
+
+def _polar(value: float, angle: float) -> tuple[float, float]:
+    """値（1〜6）と角度を SVG 座標にする（1 が中心，6 が外周．角度は右から反時計回り）．"""
+    r = (min(max(value, 1.0), 6.0) - 1.0) / 5.0 * SVG_RADIUS
+    cx, cy = SVG_CENTER
+    return cx + r * math.cos(angle), cy - r * math.sin(angle)
+
+
+def _points(pairs) -> str:
+    return " ".join(f"{x:.1f},{y:.1f}" for x, y in pairs)
+
+
+def radar_svg(values, title: str = "") -> str:
+    """6軸の値（1〜6）からレーダーチャートの SVG を組み立てる（PNG 版と同じ配色・配置）．"""
+    values = _as_values(values)
+    angles = [2 * math.pi * i / len(RADAR_LABELS) for i in range(len(RADAR_LABELS))]
+    cx, cy = SVG_CENTER
+    center = f'cx="{cx:g}" cy="{cy:g}"'
+
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {SVG_WIDTH} {SVG_HEIGHT}" '
+        f'font-family="{SVG_FONT}" fill="#4B3B2B">',
+        f'<circle {center} r="{SVG_RADIUS:g}" fill="#FFF7ED"/>',
+        '<g fill="none" stroke="#E7D7C5">',
+    ]
+    # 目盛りの同心円と軸
+    for level in range(2, 6):
+        parts.append(f'<circle {center} r="{(level - 1) / 5.0 * SVG_RADIUS:.1f}"/>')
+    spokes = "".join(f"M{cx:g} {cy:g}L{x:.1f} {y:.1f}" for x, y in (_polar(6, a) for a in angles))
+    parts.append(f'<path d="{spokes}"/></g>')
+    parts.append(f'<circle {center} r="{SVG_RADIUS:g}" fill="none" stroke="#E8B26A" stroke-width="1.4"/>')
+
+    # 値の多角形
+    poly = _points(_polar(v, a) for v, a in zip(values, angles))
+    parts.append(
+        f'<polygon points="{poly}" fill="#FDBA74" fill-opacity=".35" '
+        f'stroke="#F59E0B" stroke-width="2.4" stroke-linejoin="round"/>'
+    )
+
+    # 目盛りの数字（22度の方向）と軸ラベル
+    tick_angle = math.radians(22)
+    parts.append('<g font-size="9">')
+    for level in range(1, 7):
+        x, y = _polar(level, tick_angle)
+        parts.append(f'<text x="{x + 3:.1f}" y="{y - 2:.1f}">{level}</text>')
+    parts.append('</g><g font-size="11">')
+    for label, a in zip(RADAR_LABELS, angles):
+        x = cx + (SVG_RADIUS + 14) * math.cos(a)
+        y = cy - (SVG_RADIUS + 14) * math.sin(a) + 4
+        anchor = "start" if math.cos(a) > 0.3 else "end" if math.cos(a) < -0.3 else "middle"
+        parts.append(f'<text x="{x:.1f}" y="{y:.1f}" text-anchor="{anchor}">{label}</text>')
+    parts.append("</g>")
+
+    if title:
+        parts.append(f'<text x="{cx:g}" y="18" font-size="12" text-anchor="middle">{html.escape(title)}</text>')
+    parts.append("</svg>")
+    return "".join(parts)
+
+
+def radar_svg_data_url(values, title: str = RADAR_TITLE) -> str:
+    """radar_svg() を <img> にそのまま使える data URL にする．"""
+    return "data:image/svg+xml;charset=utf-8," + radar_svg(values, title).translate(_SVG_URL_ESCAPES)
+
+
+def configured_radar_backend() -> str:
+    """
+    secrets.toml の radar_backend（svg / png，既定 svg）を返す．
+
+    未知の値なら警告を出して svg にする（設定の書き間違いで全ページが止まらないように）．
+    """
+    name = str(st.secrets.get("radar_backend", "svg")).lower()
+    if name not in RADAR_BACKENDS:
+        warnings.warn(
+            f"未知の radar_backend: {name}（{', '.join(RADAR_BACKENDS)} のいずれか）．svg を使う",
+            RuntimeWarning,
+            stacklevel=2,
+        )
+        return "svg"
+    return name
+
+
+@traced()
+def radar_chart_url(values, title: str = RADAR_TITLE, backend: str | None = None) -> str:
+    """
+    結果カードの <img> に使うレーダーチャートの URL を返す．
+
+    svg なら data URL．png なら保存済みの PNG の URL（静的配信が無効なら data URL）．
+    """
+    if (backend or configured_radar_backend()) == "svg":
+        url = radar_svg_data_url(values, title)
+    else:
+        path = ensure_radar(values, title)
+        url = f"{RADAR_URL}/{path.name}" if _static_serving_enabled() else _inline_url(path)
+    IMAGE_PAYLOAD_BYTES.observe(len(url), kind="radar", delivery="inline" if url.startswith("data:") else "static")
+    return url
+
+
+def warm_radar_cache(feature_rows, title: str = RADAR_TITLE) -> int:
+    """
+    feature_rows（6軸の値の並び）の PNG をまとめて用意し，新しく描いた枚数を返す．
+
+    静的配信が無効なら data URL もここで読み込んでおく．
+    """
+    rendered = 0
+    inline = not _static_serving_enabled()
+    for values in {_as_values(v) for v in feature_rows}:
+        path = RADAR_DIR / f"{radar_key(values, title)}.png"
+        if not path.exists():
+            ensure_radar(values, title)
+            rendered += 1
+        if inline:
+            _inline_url(path)
+    return rendered
+
+
+def _warm_current_catalogue() -> None:
+    from catalogue import FEATURES, load_features
+
+    # 前回の失敗は今回の結果で置き換える（版が変わらず描き直さなかったときも消す）
+    with _LOCK:
+        _WARMUP["error"] = ""
+    try:
+        features = load_features()
+        if features.version != _WARMUP["version"]:
+            rows = features.data[FEATURES].to_numpy().tolist()
+            rendered = warm_radar_cache(rows)
+            with _LOCK:
+                _WARMUP.update(version=features.version, rendered=_WARMUP["rendered"] + rendered)
+    except Exception as e:
+        with _LOCK:
+            _WARMUP["error"] = f"{type(e).__name__}: {e}"
+
+
+def start_radar_warmup() -> None:
+    """
+    カタログ全品種のレーダーチャートを描くスレッドを（必要なら）起動する．
+
+    app.py から毎回呼んでよい．WARMUP_INTERVAL ごとに特徴量CSVの版を確認し，
+    変わっていたときだけ描き直す．リクエストの処理はこのスレッドを待たない．
+    SVG 版を使う設定なら何もしない．
+    """
+    if configured_radar_backend() != "png":
+        return
+
+    with _LOCK:
+        thread = _WARMUP["thread"]
+        if thread is not None and thread.is_alive():
+            return
+        if _WARMUP["started_at"] and time.monotonic() - _WARMUP["started_at"] < WARMUP_INTERVAL:
+            return
+        thread = threading.Thread(target=_warm_current_catalogue, name="radar-warmup", daemon=True)
+        _WARMUP.update(thread=thread, started_at=time.monotonic())
+    thread.start()
+
+
+def radar_warmup_stats() -> dict:
+    """warm-up の状況（対象の版・描いた枚数・直近のエラー）を返す．"""
+    with _LOCK:
+        return {k: v for k, v in _WARMUP.items() if k != "thread"}
+
+
+def _collect_radar_warmup_metrics() -> list:
+    """warm-up で描いた枚数と直近のエラーの有無を metrics に出す．"""
+    stats = radar_warmup_stats()
+    return [
+        ("radar_warmup_rendered_total", "counter", "warm-up で描いてディスクに置いたレーダーチャートの枚数",
+         [({}, stats["rendered"])]),
+        ("radar_warmup_error", "gauge", "直近の warm-up が失敗したか（1 なら失敗）",
+         [({}, int(bool(stats["error"])))]),
+    ]
+
+
+register_collector("radar_warmup", _collect_radar_warmup_metrics)
+
+
+if __name__ == "__main__":
+    from catalogue import FEATURES, load_features
+
+    t0 = time.perf_counter()
+    features = load_features()
+    n = warm_radar_cache(features.data[FEATURES].to_numpy().tolist())
+    print(f"version {features.version}: rendered {n} charts in {time.perf_counter() - t0:.1f}s -> {RADAR_DIR}")
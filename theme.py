@@ -0,0 +1,62 @@
+# theme.py
+"""
+各ページ共通の見た目（背景画像）をまとめたモジュール．
+
+以前は 1_top / 1_top_login / 3_Login / 結果ページがそれぞれ top_background.png
+（約3MB）を base64 にして CSS に埋め込んでいたため，ページ遷移やボタン操作で
+再実行されるたびに数MBの CSS を送り直していた．ここでは image_assets で
+WebP に再圧縮したものを static/ から URL で参照するので，ブラウザは画像を
+1回だけ取得してキャッシュし，再実行で送るのは短い CSS だけになる．
+静的配信が無効な環境では，再圧縮した WebP を data URL で埋め込む．
+"""
+from pathlib import Path
+
+import streamlit as st
+
+from image_assets import image_asset
+
+ROOT_DIR = Path(__file__).resolve().parent
+BACKGROUND_PATH = ROOT_DIR / "other_images" / "top_background.png"
+
+# 背景は画面全体に敷くので，縮小版の幅を大きめにとる（元画像より大きくはしない）
+BACKGROUND_WIDTH = 1920
+
+
+def background_url() -> str:
+    """背景画像の URL（静的配信が無効なら data URL）を返す．画像が無ければ空文字．"""
+    asset = image_asset(BACKGROUND_PATH, width=BACKGROUND_WIDTH)
+    if asset is None:
+        return ""
+    return asset.webp or asset.fallback
+
+
+def apply_background(fixed: bool = False, important: bool = False) -> None:
+    """
+    背景画像をページ全体に敷き，ヘッダ等を透明にする CSS を出力する．
+
+    fixed     : スクロールしても背景を動かさない（結果ページ用）
+    important : ヘッダ等の透明化を !important で強制する
+    """
+    url = background_url()
+    if not url:
+        return
+
+    attachment = "background-attachment: fixed;" if fixed else ""
+    flag = " !important" if important else ""
+    st.markdown(
+        f"""
+        <style>
+        [data-testid="stAppViewContainer"] {{
+            background-image: url("{url}");
+            background-size: cover;
+            background-position: center;
+            background-repeat: no-repeat;
+            {attachment}
+        }}
+        [data-testid="stHeader"], [data-testid="stToolbar"], [data-testid="stSidebar"] {{
+            background: transparent{flag};
+        }}
+        </style>
+        """,
+        unsafe_allow_html=True,
+    )